@@ -1,121 +1,87 @@
-from random import choices, randint
+import argparse
 from sys import exit
 import pygame as pg
 from settings import *
+from assets import registry, text_cache
+from atlas import load_hero_assets, load_startup_assets
+from background import BackgroundLayer
+from canvas import Canvas
+from display import DisplayUpdater
+from governor import FROZEN, FLAT, QualityGovernor
+from profiler import FrameProfiler, NullProfiler
+from statetrace import TraceRecorder
+from scheduler import Scheduler
+from simulation import Simulation, hero_masks
+from replay import HERO_TYPES, InputLog, parse_seed
+from loader import AssetLoader
+from audio import AudioBank
+from animation import Animator, clip
 
 pg.init()
 
+# Game Events
+HERO_DIE = pg.USEREVENT + 2
 
-def flip(images):
-    """Flips a list of images horizontally."""
-    return [pg.transform.flip(image, True, False) for image in images]
 
-
-def load_image_sheets(img_path, width, height, needScale=False, customScale=False, size=None):
-    """Splits an image into multiple sub-images (sprites) based on the given width and height, 
-    and optionally scales them."""
-    image = pg.image.load(img_path).convert_alpha()
-    image_num = image.get_width() // width
-
-    images = []
-    for i in range(image_num):
-        surface = pg.Surface((width, height), pg.SRCALPHA, depth=32)
-        rect = pg.Rect(i * width, 0, width, height)
-        surface.blit(image, (0, 0), rect)
-        if needScale:
-            surface = pg.transform.scale2x(surface)
-        elif customScale:
-            surface = pg.transform.scale(surface, size)
-        images.append(surface)
-    return images
+def render_font(text, font, color, center, scale=1):
+    """Renders a given text using the specified font and color, reusing the cached surface if possible.
+    On a canvas scale times smaller the text is rendered that much smaller, the rect is its region on the window."""
+    name, size = font
+    rendered_text = text_cache.render(text, registry.font(name, size // scale), color)
+    rendered_text_rect = pg.Rect(0, 0, rendered_text.get_width() * scale, rendered_text.get_height() * scale)
+    rendered_text_rect.center = center
+    return rendered_text, rendered_text_rect
 
 
-def render_font(text, font, color, center):
-    """Renders a given text using the specified font and color."""
-    rendered_text = font.render(text, True, color)
-    rendered_text_rect = rendered_text.get_rect(center=center)
-    return rendered_text, rendered_text_rect
+def interpolate(rect, prev_pos, alpha):
+    """Returns a copy of a rect placed between its previous and current step positions,
+    measured at the bottom center so that a change of size doesn't move it."""
+    x, y = rect.midbottom
+    return rect.move(round((prev_pos[0] - x) * (1 - alpha)), round((prev_pos[1] - y) * (1 - alpha)))
 
 
 class Hero(pg.sprite.Sprite):
-    """A class representing the Hero. 
-    It represents a game character with various attributes, 
-    such as health and direction, and actions, such as running, 
-    falling, and dying, as well as handling animations for different 
-    states like idle, running, and falling."""
+    """A class representing the Hero.
+    It draws the hero of the simulation, picking the image
+    that matches the hero's animation state and direction
+    for states like appearing, idle, running, falling and being hit.
+    The images are loaded for a canvas of the given scale."""
 
-    def __init__(self, heroType):
+    def __init__(self, heroType, hero_state, scale=1):
         super().__init__()
-        self.animation_count = 0
-        self.cutscene_played = False
-        self.health = MAX_HEALTH
-        self.direction = "left"
-        self.run = False
-        self.fall = False
-        self.hit = False
+        self.hero_state = hero_state
 
         # Load Hero Appear Image
-        self.hero_appear_img = load_image_sheets(
-            HERO_APPEAR, CUTSCENE_WIDTH, CUTSCENE_HEIGHT, True)
-        self.image = self.hero_appear_img[self.animation_count]
-        self.rect = self.image.get_rect(
-            midbottom=(HERO_X, HERO_Y))
+        self.hero_appear_img = registry.sheet(
+            HERO_APPEAR, CUTSCENE_WIDTH, CUTSCENE_HEIGHT, True, scale=scale)
 
         # Load Hero Idle Image
-        self.hero_idle_right_img = load_image_sheets(
-            HERO_IDLE[heroType], HERO_WIDTH, HERO_HEIGHT, True)
-        self.hero_idle_left_img = flip(self.hero_idle_right_img)
+        self.hero_idle_right_img = registry.sheet(
+            HERO_IDLE[heroType], HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+        self.hero_idle_left_img = registry.sheet(
+            HERO_IDLE[heroType], HERO_WIDTH, HERO_HEIGHT, True, flipped=True, scale=scale)
 
         # Load Hero Run Image
-        self.hero_run_right_img = load_image_sheets(
-            HERO_RUN[heroType], HERO_WIDTH, HERO_HEIGHT, True)
-        self.hero_run_left_img = flip(self.hero_run_right_img)
+        self.hero_run_right_img = registry.sheet(
+            HERO_RUN[heroType], HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+        self.hero_run_left_img = registry.sheet(
+            HERO_RUN[heroType], HERO_WIDTH, HERO_HEIGHT, True, flipped=True, scale=scale)
 
         # Load Hero Fall Image
-        self.hero_fall_right_img = load_image_sheets(
-            HERO_FALL[heroType], HERO_WIDTH, HERO_HEIGHT, True)
-        self.hero_fall_left_img = flip(self.hero_fall_right_img)
+        self.hero_fall_right_img = registry.sheet(
+            HERO_FALL[heroType], HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+        self.hero_fall_left_img = registry.sheet(
+            HERO_FALL[heroType], HERO_WIDTH, HERO_HEIGHT, True, flipped=True, scale=scale)
 
         # Load Hero Hit Image
-        self.hero_hit_right_img = load_image_sheets(
-            HERO_HIT[heroType], HERO_WIDTH, HERO_HEIGHT, True)
-        self.hero_hit_left_img = flip(self.hero_hit_right_img)
-
-    def hero_appear(self):
-        if self.animation_count >= len(self.hero_appear_img):
-            self.animation_count = 0
-            self.cutscene_played = True
-            self.image = self.hero_idle_left_img[int(
-                self.animation_count)]
-            self.rect = self.image.get_rect(
-                midbottom=(HERO_X, HERO_Y))
-        else:
-            self.image = self.hero_appear_img[int(self.animation_count)]
-
-    def hero_run(self):
-        key = pg.key.get_pressed()
-        if key[pg.K_LEFT] and self.rect.left - MOVING_SPEED >= WALL_WIDTH:
-            self.run = True
-            self.direction = 'left'
-            self.rect.x -= MOVING_SPEED
-        elif key[pg.K_RIGHT] and self.rect.right + MOVING_SPEED <= WIDTH - WALL_WIDTH:
-            self.run = True
-            self.direction = 'right'
-            self.rect.x += MOVING_SPEED
-        else:
-            self.run = False
-
-    def hero_fall(self):
-        if self.fall:
-            self.rect.y += FALL_SPEED
-
-    def hero_die(self):
-        if (self.rect.top <= SAW_HEIGHT // 3) or (self.rect.top >= HEIGHT):
-            self.health = 0
-            pg.event.post(pg.event.Event(HERO_DIE))
-
-    def animation(self):
-        img_list = {
+        self.hero_hit_right_img = registry.sheet(
+            HERO_HIT[heroType], HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+        self.hero_hit_left_img = registry.sheet(
+            HERO_HIT[heroType], HERO_WIDTH, HERO_HEIGHT, True, flipped=True, scale=scale)
+
+        self.img_list = {
+            ('appear', 'left'): self.hero_appear_img,
+            ('appear', 'right'): self.hero_appear_img,
             ('idle', 'left'): self.hero_idle_left_img,
             ('idle', 'right'): self.hero_idle_right_img,
             ('run', 'left'): self.hero_run_left_img,
@@ -125,79 +91,91 @@ class Hero(pg.sprite.Sprite):
             ('hit', 'left'): self.hero_hit_left_img,
             ('hit', 'right'): self.hero_hit_right_img,
         }
+        self.update()
+        self.remember()
 
-        if self.hit:
-            state = 'hit'
-        elif self.fall:
-            state = 'fall'
-        elif self.run:
-            state = 'run'
-        else:
-            state = 'idle'
+    def update(self):
+        state = self.hero_state
+        self.image = self.img_list[(state.state, state.direction)][state.frame]
+        self.rect = state.rect
 
-        images = img_list[(state, self.direction)]
-        if self.animation_count >= len(images):
-            if state == 'hit':
-                self.hit = False
-            self.animation_count = 0
-        self.image = images[int(self.animation_count)]
+    def remember(self):
+        """Keeps the position before the next simulation step to interpolate from."""
+        self.prev_pos = self.hero_state.rect.midbottom
 
-    def update(self):
-        self.animation_count += 0.2
-        if not self.cutscene_played:
-            self.hero_appear()
-        else:
-            self.hero_die()
-            self.hero_fall()
-            self.hero_run()
-            self.animation()
+    def interpolate(self, alpha):
+        self.rect = interpolate(self.hero_state.rect, self.prev_pos, alpha)
 
 
 class Terrain(pg.sprite.Sprite):
     """A class representing the Terrain.
-    Its main functions include initializing the terrain object 
-    with its properties, updating its position and animation, 
-    and destroying the object when it goes out of bounds."""
+    It draws a terrain tile of the simulation, animating
+    conveyor tiles on the shared animator, and removes itself once the simulation
+    has destroyed or recycled the tile. Removed sprites are
+    kept in the terrain pool and reused by the next spawns.
+    The images are loaded for a canvas of the given scale."""
 
-    def __init__(self, terrainType, pos):
+    def __init__(self, terrain_state, scale=1):
         super().__init__()
-        self.type = terrainType
-        self.has_dealt_damage = False
-        self.has_dealt_heal = False
-        self.has_trigger = False
-        self.animation_count = 0
+        self.scale = scale
+        self.reset(terrain_state)
+
+    def reset(self, terrain_state):
+        self.terrain_state = terrain_state
+        self.generation = terrain_state.generation
+        self.type = terrain_state.type
 
         # Load Terrain Image
         if self.type in ['conveyor_tile_right', 'conveyor_tile_left']:
-            self.conveyor_img = load_image_sheets(
+            self.conveyor_img = registry.sheet(
                 TERRAIN[self.type], CONVEYOR_WIDTH, CONVEYOR_HEIGHT,
-                customScale=True, size=(TERRAIN_WIDTH, TERRAIN_HEIGHT))
-            if self.type == 'conveyor_tile_left':
-                self.conveyor_img = flip(self.conveyor_img)
-            self.image = self.conveyor_img[self.animation_count]
+                customScale=True, size=(TERRAIN_WIDTH, TERRAIN_HEIGHT),
+                flipped=self.type == 'conveyor_tile_left', scale=self.scale)
+            animator.add(self, clip(self.conveyor_img))
         else:
-            self.image = pg.transform.scale(pg.image.load(
-                TERRAIN[self.type]).convert(), (TERRAIN_WIDTH, TERRAIN_HEIGHT))
-        self.rect = self.image.get_rect(midtop=pos)
+            animator.remove(self)
+            self.image = registry.image(
+                TERRAIN[self.type], (TERRAIN_WIDTH, TERRAIN_HEIGHT), alpha=False, scale=self.scale)
+        self.rect = terrain_state.rect
+        self.remember()
 
-    def terrain_move(self):
-        self.rect.y -= TERRAIN_SPEED
+    def remember(self):
+        """Keeps the position before the next simulation step to interpolate from."""
+        self.prev_pos = self.terrain_state.rect.midbottom
 
-        if self.type in ('conveyor_tile_right', 'conveyor_tile_left'):
-            if self.animation_count >= len(self.conveyor_img):
-                self.animation_count = 0
-            self.image = self.conveyor_img[int(self.animation_count)]
+    def interpolate(self, alpha):
+        self.rect = interpolate(self.terrain_state.rect, self.prev_pos, alpha)
+
+    def terrain_move(self):
+        self.rect = self.terrain_state.rect
 
     def destroy(self):
-        if self.rect.y <= -TERRAIN_HEIGHT:
+        state = self.terrain_state
+        if not state.alive or state.generation != self.generation:
             self.kill()
+            animator.remove(self)
+            terrain_pool.append(self)
 
     def update(self):
-        self.animation_count += 0.2
         self.terrain_move()
         self.destroy()
 
 
+def load_hero(hero_type, scale=1):
+    """Loads the sheets and collision masks that are only needed once the given hero is played."""
+    load_hero_assets(registry, hero_type, USE_ATLAS, scale)
+    hero_masks(hero_type)
+
+
+def spawn_terrain(terrain_state, scale=1):
+    """Returns a sprite drawing the given tile, reusing a pooled sprite if possible."""
+    if terrain_pool:
+        terrain = terrain_pool.pop()
+        terrain.reset(terrain_state)
+        return terrain
+    return Terrain(terrain_state, scale)
+
+
 class Game:
     """Main game class for Leap of Faith.
     It is responsible for handling game mechanics, including initialization, 
@@ -205,7 +183,21 @@ class Game:
     The main loop of the game continuously executes, updating game states 
     and drawing elements on the screen."""
 
-    def __init__(self):
+    def __init__(self, seed=None, record_path=None, replay_path=None, speed=1,
+                 display_mode=DISPLAY_MODE, display_stats=False, profile_path=None, render_fps=RENDER_FPS,
+                 canvas_mode=CANVAS_MODE, trace_path=None, quality=QUALITY_MODE):
+        self.seed = seed
+        self.record_path = record_path
+        self.speed = speed
+        self.render_fps = render_fps
+        self.display_mode = display_mode
+        self.scale = CANVAS_SCALES[canvas_mode]
+        self.display_stats = display_stats
+        self.profile_path = profile_path
+        self.trace_path = trace_path
+        self.quality = quality
+        self.replay_log = None if replay_path is None else InputLog.load(
+            replay_path)
         self.setup()
         self.load_resources()
 
@@ -213,131 +205,240 @@ class Game:
         self.game_active = False
         self.clock = pg.time.Clock()
         self.saw_index = 0
+        self.saw_start = 0
         self.frame_counter = 0
-        self.animation_count = 0
         self.wall_offset = 0
         self.level = TOP_LEVEL
-        self.fall_dist = 0
-        self.hero_prevPos = HERO_Y
-        self.triggered_empty_tiles = []
+        self.highlighted = None
+        self.simulation = None
+        self.input_log = None
+        self.replay_actions = None
+        self.scheduler = Scheduler()
+        self.display = DisplayUpdater(self.display_mode, self.scale)
+        self.profiler = NullProfiler() if self.profile_path is None else \
+            FrameProfiler(self.profile_path)
+        self.tracer = None if self.trace_path is None else TraceRecorder(self.trace_path)
+        # Uncapped frames are held to the time of one step
+        self.governor = QualityGovernor(1000 / self.render_fps if self.render_fps else STEP_TIME, self.quality)
+        self.hud = []
         self.screen = pg.display.set_mode((WIDTH, HEIGHT))
+        self.canvas = Canvas(self.screen, self.scale)
         pg.display.set_caption('Leap of Faith: The 100-Floor Trials')
-        pg.time.set_timer(TERRAIN_SPAWN, TERRAIN_SPAWN_FREQ)
 
     def load_resources(self):
+        """Starts decoding the images and sounds on worker threads, while the loading screen is shown."""
+        self.loaded = False
+        self.loader = AssetLoader()
+        self.loader.submit('images', load_startup_assets, registry, USE_ATLAS, self.scale)
+        self.audio = AudioBank()
+        self.loader.submit('bgm', self.audio.load_music, BGM)
+        for name, (sound_path, category) in SOUND_EFFECTS.items():
+            self.loader.submit(name, self.audio.load, name, sound_path, category)
+        self.startup_tasks = ['images', 'bgm'] + list(SOUND_EFFECTS)
+
+    def finish_loading(self):
+        """Picks up the loaded assets on the main thread once every startup task has finished."""
         self.load_fonts()
         self.load_images()
         self.load_sounds()
+        self.loaded = True
+        if self.replay_log is not None:
+            self.start_replay(self.replay_log)
+
+    def wait_until_loaded(self):
+        """Blocks until every startup asset is loaded, e.g. for tools that drive the game directly."""
+        for name in self.startup_tasks:
+            self.loader.result(name)
+        self.finish_loading()
+
+    def prefetch_hero(self, hero_type):
+        """Starts loading the sheets of a hero on a worker thread and returns the task's future."""
+        return self.loader.submit(('hero', hero_type), load_hero, hero_type, self.scale)
 
     def load_fonts(self):
         self.game_mainName, self.game_mainName_rect = render_font(
-            'Leap of Faith', TITLE_FONT, 'darkgoldenrod1', (WIDTH // 2, GAMENAME_HEIGHT))
+            'Leap of Faith', TITLE_FONT, 'darkgoldenrod1', (WIDTH // 2, GAMENAME_HEIGHT), self.scale)
         self.game_subName, self.game_subName_rect = render_font(
-            'The 100-Floor Trials', SUBTITLE_FONT, 'darkgoldenrod1', (WIDTH // 2, GAMESUBNAME_HEIGHT))
+            'The 100-Floor Trials', SUBTITLE_FONT, 'darkgoldenrod1', (WIDTH // 2, GAMESUBNAME_HEIGHT), self.scale)
         self.game_message, self.game_message_rect = render_font(
-            'Choose a hero to play!', SUBTITLE_FONT, 'red', (WIDTH // 2, GAMEMESSAGE_HEIGHT))
+            'Choose a hero to play!', SUBTITLE_FONT, 'red', (WIDTH // 2, GAMEMESSAGE_HEIGHT), self.scale)
         self.win_message, self.win_message_rect = render_font(
-            "My hero, you've completed the leap of faith! Congratulations!", WIN_FONT, 'red', (WIDTH // 2, SCOREMESSAGE_HEIGHT))
+            "My hero, you've completed the leap of faith! Congratulations!", WIN_FONT, 'red', (WIDTH // 2, SCOREMESSAGE_HEIGHT),
+            self.scale)
 
     def load_images(self):
-
         # Load BackGround Images
-        self.background = pg.image.load(BACKGROUND).convert()
-        self.tower_BG = pg.transform.scale(
-            pg.image.load(TOWER_BG).convert(), (WIDTH, HEIGHT))
-        self.saw = load_image_sheets(SAW, SAW_WIDTH, SAW_HEIGHT)
-        self.wall = pg.transform.scale(pg.image.load(
-            WALL).convert(), (WALL_WIDTH, WALL_HEIGHT))
+        scale = self.scale
+        self.background = registry.image(BACKGROUND, alpha=False, scale=scale)
+        self.tower_BG = registry.image(TOWER_BG, (WIDTH, HEIGHT), alpha=False, scale=scale)
+        self.saw = registry.sheet(SAW, SAW_WIDTH, SAW_HEIGHT, scale=scale)
+        self.saw_clip = clip(self.saw, SAW_SPEED)
+        self.wall = registry.image(WALL, (WALL_WIDTH, WALL_HEIGHT), alpha=False, scale=scale)
+        self.background_layer = BackgroundLayer(
+            self.background, self.saw, self.wall, scale)
 
         # Load HUD
-        self.hud_number = [pg.image.load(HUD_NUMBER[i]).convert_alpha()
+        self.hud_number = [registry.image(HUD_NUMBER[i], scale=scale)
                            for i in range(len(HUD_NUMBER))]
-        self.hero_initImgs = [load_image_sheets(HERO_IDLE[hero_name],
-                                                HERO_WIDTH, HERO_HEIGHT, True)
-                              for hero_name in ['MaskDude', 'NinjaFrog', 'PinkMan']]
-        self.heart_full = pg.image.load(HEARTFULL).convert_alpha()
-        self.heart_empty = pg.image.load(HEARTEMPTY).convert_alpha()
+        self.hero_initImgs = [registry.sheet(HERO_IDLE[hero_name],
+                                             HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+                              for hero_name in HERO_TYPES]
+        # Every hero runs through its own sheet, whatever the length of the others
+        self.hero_initClips = [clip(hero_img) for hero_img in self.hero_initImgs]
+        self.hero_slots = [pg.Rect(HERO_SPACING + (HERO_WIDTH * 2 + HERO_SPACING) * i, HEIGHT // 2,
+                                   HERO_WIDTH * 2, HERO_HEIGHT * 2)
+                           for i in range(len(HERO_TYPES))]
+        self.heart_full = registry.image(HEARTFULL, scale=scale)
+        self.heart_empty = registry.image(HEARTEMPTY, scale=scale)
 
     def load_sounds(self):
-        pg.mixer.music.load(BGM)
-        pg.mixer.music.play(loops=-1)
-        pg.mixer.music.set_volume(0.3)
-        self.heal_sound = pg.mixer.Sound(HEAL_SOUND)
-        self.sting_sound = pg.mixer.Sound(STING_SOUND)
-        self.break_sound = pg.mixer.Sound(BREAK_SOUND)
-        self.maskdude_sound = pg.mixer.Sound(MASKDUDE_SOUND)
-        self.ninjafrog_sound = pg.mixer.Sound(NINJAFROG_SOUND)
-        self.pinkman_sound = pg.mixer.Sound(PINKMAN_SOUND)
-
-    def reset_game(self, hero_type):
+        for name in ['bgm'] + list(SOUND_EFFECTS):
+            self.loader.result(name)
+        self.audio.play_music(0.3)
+
+    def reset_game(self, hero_type, seed=None, spawnTicks=TERRAIN_SPAWN_TICKS):
+        # Only the chosen hero's sheets are waited for, the others keep loading lazily
+        self.prefetch_hero(hero_type).result()
         self.game_active = True
         self.frame_counter = 0
+        self.scheduler.clear()
         self.saw_index = 0
-        self.animation_count = 0
+        self.saw_start = animator.tick
         self.level = TOP_LEVEL
-        self.fall_dist = 0
-        self.hero_prevPos = HERO_Y
+        # Reuse the simulation so its terrain pool carries over between runs
+        seed = self.seed if seed is None else seed
+        if self.simulation is None:
+            self.simulation = Simulation(hero_type, seed, spawnTicks)
+            self.profiler.instrument(
+                self.simulation, 'collision', 'collision', 'simulation')
+        else:
+            self.simulation.reset(hero_type, seed, spawnTicks)
+        if self.record_path is not None:
+            self.input_log = InputLog(hero_type, self.simulation.seed)
         hero.empty()
+        terrain_pool.extend(terrains)
         terrains.empty()
-        hero.add(Hero(hero_type))
-        terrains.add(Terrain('common_tile', (WIDTH // 2, HEIGHT)))
-        pg.time.set_timer(TERRAIN_SPAWN, TERRAIN_SPAWN_FREQ)
+        animator.clear()
+        hero.add(Hero(hero_type, self.simulation.hero, self.scale))
+        terrains.add(spawn_terrain(terrain, self.scale)
+                     for terrain in self.simulation.terrains)
+
+    def start_replay(self, log):
+        """Starts playing back a recorded run instead of reading the keyboard."""
+        self.reset_game(log.hero_type, log.seed)
+        self.replay_actions = log.actions()
+
+    def save_input_log(self):
+        """Writes the input log of the current run to the record path."""
+        if self.input_log is not None:
+            self.input_log.finish(self.simulation)
+            self.input_log.save(self.record_path)
+            self.input_log = None
 
     def handle_events(self):
         for event in pg.event.get():
             if event.type == pg.QUIT:
+                self.save_input_log()
+                self.profiler.export()
+                if self.tracer is not None:
+                    self.tracer.close()
+                if self.display_stats:
+                    print(self.display.stats())
+                    print(text_cache.stats())
+                    print(self.governor.stats())
+                self.loader.shutdown()
                 pg.quit()
                 exit()
 
+            if event.type == pg.KEYDOWN and event.key == pg.K_F12:
+                self.profiler.export()
+
             if self.game_active:
 
                 if event.type == HERO_DIE:
-                    pg.time.delay(DELAY_TIME)
-                    self.game_active = False
+                    # Keep drawing the last moments while waiting to return to the menu
+                    self.scheduler.schedule(
+                        self.frame_counter + DELAY_FRAMES, self.end_game)
+
+            elif self.loaded:
+                # Prefetch the sheets of the hero under the mouse
+                if event.type == pg.MOUSEMOTION:
+                    i = pg.Rect(event.pos, (1, 1)).collidelist(self.hero_slots)
+                    if i != -1:
+                        self.highlighted = i
+                        self.prefetch_hero(HERO_TYPES[i])
 
-                if event.type == TERRAIN_SPAWN:
-                    terrain_type = choices(
-                        list(TERRAIN.keys()), TERRAIN_SPAWN_WEIGHTS)[0]
-                    terrains.add(
-                        Terrain(terrain_type, (randint(
-                            TERRAIN_SPAWNLEFT, TERRAIN_SPAWNRIGHT), HEIGHT)))
-
-            else:
                 if event.type == pg.KEYDOWN:
                     hero_type = None
                     if event.key == pg.K_1:
                         hero_type = 'MaskDude'
-                        self.maskdude_sound.play()
+                        self.audio.play('maskdude')
                     elif event.key == pg.K_2:
                         hero_type = 'NinjaFrog'
-                        self.ninjafrog_sound.play()
+                        self.audio.play('ninjafrog')
                     elif event.key == pg.K_3:
                         hero_type = 'PinkMan'
-                        self.pinkman_sound.play()
+                        self.audio.play('pinkman')
                     if hero_type is not None:
                         self.reset_game(hero_type)
 
-    def draw_background(self):
-        # Draw Background
-        for x in range(0, WIDTH, BG_WIDTH):
-            for y in range(0, HEIGHT, BG_HEIGHT):
-                self.screen.blit(self.background, (x, y))
-
-        # Draw Saws
-        for i in range(NUM_SAW):
-            x_pos = i * (SAW_SPACING + SAW_WIDTH)
-            self.screen.blit(self.saw[self.saw_index],
-                             (x_pos + WALL_WIDTH, -SAW_HEIGHT // 2))
-        if self.frame_counter % SAW_SPEED == 0:
-            self.saw_index = (self.saw_index + 1) % len(self.saw)
-
-        # Draw Wall
-        for j in range(NUM_WALL + 1):
-            y_pos = self.wall_offset + j * WALL_HEIGHT
-            left_wall_x = 0
-            right_wall_x = WIDTH - WALL_WIDTH
-            self.screen.blit(self.wall, (left_wall_x, y_pos))
-            self.screen.blit(self.wall, (right_wall_x, y_pos))
+    def end_game(self):
+        """Returns to the menu, scheduled DELAY_FRAMES after the hero died."""
+        self.game_active = False
+
+    def read_action(self):
+        """Reads the hero action for this step from the replayed log or the arrow keys."""
+        if self.replay_actions is not None:
+            return next(self.replay_actions, ACTION_IDLE)
+        key = pg.key.get_pressed()
+        return ACTION_LEFT * key[pg.K_LEFT] | ACTION_RIGHT * key[pg.K_RIGHT]
+
+    def step_simulation(self):
+        """Advances the simulation by one step, recording the action."""
+        for sprite in (*terrains, *hero):
+            sprite.remember()
+        if self.simulation.done:
+            return
+        action = self.read_action()
+        if self.input_log is not None:
+            self.input_log.record(action)
+        events = self.simulation.step(action)
+        if self.tracer is not None:
+            self.tracer.record(self.simulation, action, events)
+        self.handle_simulation_events(events)
+        if self.simulation.done:
+            self.save_input_log()
+            self.replay_actions = None
+
+    def handle_simulation_events(self, events):
+        """Plays sounds, updates the HUD and adds sprites for the events of a simulation step."""
+        for name, payload in events:
+            if name == 'spawn':
+                terrains.add(spawn_terrain(payload, self.scale))
+            elif name == 'damage':
+                self.cal_damage()
+            elif name == 'heal':
+                self.cal_heal()
+            elif name == 'break':
+                self.audio.play('break')
+            elif name == 'die':
+                pg.event.post(pg.event.Event(HERO_DIE))
+
+    def draw_background(self, alpha=1):
+        # Draw Pre-composited Background, Saws and Walls, the Walls Between Their Last Two Steps
+        if self.governor.level >= FLAT:
+            self.display.add(*self.background_layer.draw_flat(self.canvas.surface, self.saw_index))
+            return
+        wall_offset = self.wall_offset + round(TERRAIN_SPEED * (1 - alpha))
+        if wall_offset > 0:
+            wall_offset -= WALL_HEIGHT
+        self.display.add(*self.background_layer.draw(
+            self.canvas.surface, self.saw_index, wall_offset))
+
+    def scroll_background(self):
+        # Update saw animation, unless the quality level froze it
+        if self.governor.level < FROZEN:
+            self.saw_index = animator.frame(self.saw_clip, self.saw_start)
 
         # Update wall position and reset it when disappears
         self.wall_offset -= TERRAIN_SPEED
@@ -346,173 +447,246 @@ class Game:
 
     def display_health(self):
         heart_y_pos = SAW_HEIGHT // 2
+        heart_rects = []
         for i in range(MAX_HEALTH - 1, -1, -1):
-            heart_x_pos = (i + 1) * self.heart_full.get_width() + \
+            heart_x_pos = (i + 1) * self.heart_full.get_width() * self.scale + \
                 i * HEART_SPACING
 
-            if i < hero.sprite.health:
-                self.screen.blit(self.heart_full, (heart_x_pos, heart_y_pos))
-            else:
-                self.screen.blit(self.heart_empty, (heart_x_pos, heart_y_pos))
+            heart = self.heart_full if i < self.simulation.hero.health else self.heart_empty
+            heart_rects.append(self.canvas.blit(heart, (heart_x_pos, heart_y_pos)))
+            self.hud.append((heart, (heart_x_pos, heart_y_pos)))
+        self.display.changed(
+            'health', self.simulation.hero.health, *heart_rects)
 
     def display_level(self):
         LEVEL_DISPLAY_OFFSET
-        self.level = TOP_LEVEL - self.fall_dist // HEIGHT
+        self.level = self.simulation.level
         if self.level == 0:
             self.game_active = False
-        score_text = LEVEL_FONT.render(
-            f'Level: {self.level}', True, 'red')
-        score_rect = score_text.get_rect(right=WIDTH-LEVEL_DISPLAY_OFFSET)
-        self.screen.blit(score_text, score_rect)
+        score_text = text_cache.render(
+            f'Level: {self.level}', registry.font(LEVEL_FONT[0], LEVEL_FONT[1] // self.scale), 'red')
+        score_rect = self.canvas.rect(score_text, right=WIDTH-LEVEL_DISPLAY_OFFSET)
+        self.canvas.blit(score_text, score_rect)
+        self.hud.append((score_text, score_rect))
+        self.display.changed('level', self.level, score_rect)
+
+    def display_hud(self):
+        """Draws the level and health, or at the sparse HUD quality level redraws
+        the images of the last recomputed HUD on every other frame."""
+        if self.governor.refresh_hud():
+            self.hud.clear()
+            self.display_level()
+            self.display_health()
+        else:
+            for image, position in self.hud:
+                self.canvas.blit(image, position)
+
+    def display_loading_screen(self):
+        progress = self.loader.progress(self.startup_tasks)
+        self.canvas.fill('black')
+        loading_text, loading_text_rect = render_font(
+            'Loading...', SUBTITLE_FONT, 'darkgoldenrod1', (WIDTH // 2, HEIGHT // 2 - 50), self.scale)
+        self.canvas.blit(loading_text, loading_text_rect)
+
+        # Draw Progress Bar
+        bar_rect = pg.Rect(0, 0, WIDTH // 2, 24)
+        bar_rect.center = (WIDTH // 2, HEIGHT // 2 + 20)
+        self.canvas.draw_rect('darkgoldenrod1', bar_rect, 2)
+        fill_rect = bar_rect.inflate(-8, -8)
+        fill_rect.width = int(fill_rect.width * progress)
+        self.canvas.draw_rect('darkgoldenrod1', fill_rect)
+        self.display.changed('loading', progress, bar_rect)
+
+        if progress == 1:
+            self.finish_loading()
 
     def display_pregame_hud(self):
+        hero_rects = []
+        hero_frames = []
         for i in range(len(self.hero_initImgs)):
-            hero_img = self.hero_initImgs[i]
-            if self.animation_count >= len(hero_img):
-                self.animation_count = 0
+            hero_frames.append(animator.frame(self.hero_initClips[i]))
 
-            x_position = HERO_SPACING + (HERO_WIDTH * 2 + HERO_SPACING) * i
-            y_position = HEIGHT // 2
+            x_position, y_position = self.hero_slots[i].topleft
 
             # Draw Heroes
-            self.screen.blit(
-                hero_img[int(self.animation_count)], (x_position, y_position))
+            hero_rects.append(self.canvas.blit(
+                self.hero_initImgs[i][hero_frames[-1]], (x_position, y_position)))
             # Draw HUD Numbers
-            self.screen.blit(
+            self.canvas.blit(
                 self.hud_number[i], (x_position + HUD_NUMBER_OFFSET_X,
                                      y_position + HUD_NUMBER_OFFSET_Y))
+        self.display.changed(
+            'hero_frame', tuple(hero_frames), *hero_rects)
+
+        # Frame the Highlighted Hero
+        highlight_rects = [slot.inflate(16, 16) for slot in self.hero_slots]
+        if self.highlighted is not None:
+            self.canvas.draw_rect('darkgoldenrod1',
+                                  highlight_rects[self.highlighted], 2)
+        self.display.changed('highlight', self.highlighted, *highlight_rects)
 
     def display_pregame_messages(self):
         # Display Game Main Title and Subtitle
-        self.screen.blit(self.game_mainName, self.game_mainName_rect)
-        self.screen.blit(self.game_subName, self.game_subName_rect)
+        self.canvas.blit(self.game_mainName, self.game_mainName_rect)
+        self.canvas.blit(self.game_subName, self.game_subName_rect)
 
         # Display Game Start Message
         if self.level == 100:
             if self.frame_counter % FPS < 30:
-                self.screen.blit(self.game_message, self.game_message_rect)
+                self.canvas.blit(self.game_message, self.game_message_rect)
+            self.display.changed('message', self.frame_counter % FPS < 30,
+                                 self.game_message_rect)
         # Display Winner Message
         elif self.level == 0:
             if self.frame_counter % FPS < 30:
-                self.screen.blit(self.win_message, self.win_message_rect)
+                self.canvas.blit(self.win_message, self.win_message_rect)
+            self.display.changed('message', self.frame_counter % FPS < 30,
+                                 self.win_message_rect)
         # Display Level Score
         else:
             score_message, score_message_rect = render_font(
                 f'Your Final Level: {self.level}', LEVEL_FONT, 'red',
-                (WIDTH // 2, SCOREMESSAGE_HEIGHT))
-            self.screen.blit(score_message, score_message_rect)
+                (WIDTH // 2, SCOREMESSAGE_HEIGHT), self.scale)
+            self.canvas.blit(score_message, score_message_rect)
 
     def cal_damage(self):
-        hero.sprite.hit = True
-        hero.sprite.health -= 1
-        self.sting_sound.play()
-        self.display_health()
-        pg.display.update()
-        if hero.sprite.health <= 0:
-            pg.event.post(pg.event.Event(HERO_DIE))
+        self.audio.play('sting')
 
     def cal_heal(self):
-        if hero.sprite.health < MAX_HEALTH:
-            hero.sprite.health += 1
-            self.heal_sound.play()
-            self.display_health()
-            pg.display.update()
-
-    def cal_fallDist(self):
-        if (dist := hero.sprite.rect.bottom - self.hero_prevPos) > 0:
-            self.fall_dist += dist
-        self.hero_prevPos = hero.sprite.rect.bottom
-
-    def empty_tile_destroy(self):
-        current_time = pg.time.get_ticks()
-        for terrain, trigger_time in self.triggered_empty_tiles:
-            if current_time - trigger_time >= EMPTY_TILE_TRIGGER_TIME:
-                self.break_sound.play()
-                self.triggered_empty_tiles.remove((terrain, trigger_time))
-                terrain.kill()
-
-    def collision(self, terrains):
-        for terrain in terrains:
-            if pg.sprite.collide_mask(hero.sprite, terrain):
-                # Check if hero hits the top of the terrain
-                if hero.sprite.rect.bottom <= terrain.rect.top + COLLISION_THRESHOLD:
-                    hero.sprite.rect.bottom = terrain.rect.top
-                    hero.sprite.fall = False
-                    # If the terrain is a spike_tile and hasn't dealt damage yet, apply damage
-                    if terrain.type == 'spike_tile' and not terrain.has_dealt_damage:
-                        self.cal_damage()
-                        terrain.has_dealt_damage = True
-                    # If the terrain is a heal_tile and hasn't healed yet, apply healing
-                    elif terrain.type == 'heal_tile' and not terrain.has_dealt_heal:
-                        self.cal_heal()
-                        terrain.has_dealt_heal = True
-                    elif terrain.type == 'empty_tile' and not terrain.has_trigger:
-                        self.triggered_empty_tiles.append(
-                            (terrain, pg.time.get_ticks()))
-                        terrain.has_trigger = True
-                    elif terrain.type == 'conveyor_tile_left':
-                        hero.sprite.rect.x -= CONVEYOR_SPEED
-                    elif terrain.type == 'conveyor_tile_right':
-                        hero.sprite.rect.x += CONVEYOR_SPEED
-
-                # Check if hero hits the sides of the terrain
-                else:
-                    if hero.sprite.rect.left < terrain.rect.left:
-                        hero.sprite.rect.right = terrain.rect.left
-                    elif hero.sprite.rect.right > terrain.rect.right:
-                        hero.sprite.rect.left = terrain.rect.right
-                    hero.sprite.fall = True
-                break
-        else:
-            # If no collision was detected, set the hero's fall state to True
-            hero.sprite.fall = True
+        self.audio.play('heal')
 
     def main_loop(self):
-        """This is the game main loop."""
+        """This is the game main loop.
+        The elapsed time is gathered in an accumulator and spent in fixed steps of STEP_TIME,
+        so the game keeps its real-time speed and drops rendered frames when the host falls behind."""
+        accumulator = 0
         while True:
-            self.clock.tick(FPS)
-            self.frame_counter += FRAME_INCREMENT
-            self.animation_count += ANIMATION_INCREMENT
-
-            # Handle Events
-            self.handle_events()
-
-            if self.game_active:
-                # Display Game Background
-                self.draw_background()
-                # Draw Sprites
-                terrains.draw(self.screen)
-                hero.draw(self.screen)
-                # Update Sprites
-                terrains.update()
-                hero.update()
-
-                # Perform Collision Detection and Calculate Falling Distance
-                if hero.sprite.cutscene_played:
-                    self.collision(terrains)
-                    self.cal_fallDist()
-                    self.empty_tile_destroy()
-
-                # Display HUD
-                self.display_level()
-                self.display_health()
-            else:
-                # Generate Pre-game Screen
-                self.screen.blit(self.tower_BG, (0, 0))
-                # Display HUD
-                self.display_pregame_hud()
-                self.display_pregame_messages()
-
-            pg.display.update()
-
-
-# Create Class Instances and Add Sprites
-game = Game()
-
+            # Longer frames are cut short, so one stall can't snowball into ever longer frames
+            accumulator += min(self.clock.tick(self.render_fps), MAX_FRAME_TIME) * self.speed
+            # The raw time leaves out the wait for the frame cap, so it is what the last frame cost
+            if self.governor.add(self.clock.get_rawtime()):
+                self.display.invalidate()
+            steps = int(accumulator // STEP_TIME)
+            accumulator -= steps * STEP_TIME
+            self.run_frame(steps, accumulator / STEP_TIME)
+
+    def step(self):
+        """Advances the timers, animations, due actions and the simulation by one fixed step."""
+        profiler = self.profiler
+        self.frame_counter += FRAME_INCREMENT
+        animator.advance()
+        self.scheduler.run_due(self.frame_counter)
+        profiler.mark('events')
+
+        if self.game_active:
+            self.scroll_background()
+            profiler.mark('background')
+            self.step_simulation()
+            profiler.mark('simulation')
+            terrains.update()
+            profiler.mark('terrains_update')
+            hero.update()
+            profiler.mark('hero_update')
+
+    def run_frame(self, steps=1, alpha=1):
+        """Handles the events, advances the game by the given number of fixed steps and draws one frame.
+        alpha is the fraction of a step elapsed since the last one, the sprites are drawn that far
+        between their last two positions."""
+        profiler = self.profiler
+        profiler.begin_frame()
+
+        # Handle Events and Step the Game
+        self.handle_events()
+        profiler.mark('events')
+        for _ in range(steps):
+            self.step()
+        self.display.changed(
+            'screen', self.game_active if self.loaded else 'loading')
+        profiler.mark('events')
+
+        if not self.loaded:
+            # Show Loading Progress
+            self.display_loading_screen()
+            profiler.mark('pregame')
+        elif self.game_active:
+            # Display Game Background
+            self.draw_background(alpha)
+            profiler.mark('background')
+            # Draw Sprites, Setting the Animated Images in One Pass First Unless the Quality Level Froze Them
+            if self.governor.level < FROZEN:
+                animator.update()
+            for sprite in (*terrains, *hero):
+                sprite.interpolate(alpha)
+            self.canvas.draw(terrains)
+            self.display.track_sprites('terrains', terrains)
+            profiler.mark('terrains_draw')
+            self.canvas.draw(hero)
+            self.display.track_sprites('hero', hero)
+            profiler.mark('hero_draw')
+
+            # Display HUD
+            self.display_hud()
+            profiler.mark('hud')
+        else:
+            # Generate Pre-game Screen
+            self.canvas.blit(self.tower_BG, (0, 0))
+            # Display HUD
+            self.display_pregame_hud()
+            self.display_pregame_messages()
+            profiler.mark('pregame')
+
+        # Upscale the Changed Parts of the Canvas, the Profiler Overlay Is Drawn at Window Resolution on Top
+        self.canvas.present(self.display.pending())
+        profiler.mark('present')
+        profiler.draw_overlay(self.screen, self.display)
+        profiler.mark('profiler')
+        self.display.update()
+        profiler.mark('display')
+        profiler.end_frame()
+
+
+# Create Sprite Groups, Terrain Sprite Pool and the Shared Animation Clock
 terrains = pg.sprite.Group()
-terrains.add(Terrain('common_tile', (WIDTH // 2, HEIGHT)))
-
 hero = pg.sprite.GroupSingle()
-
-# Run Main Loop
-game.main_loop()
+terrain_pool = []
+animator = Animator()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Leap of Faith: The 100-Floor Trials')
+    parser.add_argument('--seed', type=parse_seed,
+                        help='seed of the terrain spawns, random for every run by default')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the input log of each run to PATH')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='play back a recorded input log')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='playback speed, e.g. 4 for a 4x playback')
+    parser.add_argument('--fps', type=int, default=RENDER_FPS,
+                        help=f'rendered frames per second cap, 0 for uncapped, {RENDER_FPS} by default; '
+                             f'the game always steps {FPS} times per second')
+    parser.add_argument('--display', choices=('dirty', 'full'), default=DISPLAY_MODE,
+                        help='push only the changed screen regions or the whole window every frame')
+    parser.add_argument('--canvas', choices=tuple(CANVAS_SCALES), default=CANVAS_MODE,
+                        help='draw on the window at full resolution, or on a canvas at the art\'s native '
+                             'resolution upscaled once per frame')
+    parser.add_argument('--display-stats', action='store_true',
+                        help='print the display update and text cache counters on exit')
+    parser.add_argument('--profile', nargs='?', const='profile.json', metavar='PATH',
+                        help='time every phase of each frame, show p50/p99 frame times and write the trace '
+                             'to PATH (.json or .csv) on exit or when F12 is pressed')
+    parser.add_argument('--trace', metavar='PATH',
+                        help=f'record the simulation state of every step to a ring file at PATH keeping the '
+                             f'last {TRACE_FRAMES} steps, read it with statetrace.py')
+    parser.add_argument('--quality', choices=('auto',) + QUALITY_LEVELS, default=QUALITY_MODE,
+                        help='let the governor lower the drawing quality while frames take longer than their '
+                             'budget and raise it again when they leave headroom, or pin a quality level')
+    args = parser.parse_args()
+
+    # Create Class Instances
+    game = Game(args.seed, args.record, args.replay, args.speed,
+                args.display, args.display_stats, args.profile, args.fps, args.canvas,
+                args.trace, args.quality)
+
+    # Run Main Loop
+    game.main_loop()
@@ -0,0 +1,95 @@
+from settings import *
+
+"""
+The animation module for the "Leap of Faith: The 100-Floor Trials" game. This module holds the one animation system
+every animated image shares. A clip is made once per sheet and turns the number of ticks since the animation started
+into a frame index with a precomputed table, and a shared clock advanced once per game step drives all of them,
+so sprites keep no counters of their own and nothing is added up in floats while the game runs.
+
+The tables reproduce the float counter the game always used, which adds ANIMATION_INCREMENT every step and wraps
+once it reaches the sheet length, including its rounding, so every frame shows exactly when it used to. The hero's
+animation in the simulation decides its collision mask, so this keeps runs and replays unchanged.
+"""
+
+MAX_CLIP_FRAMES = 64  # Longest Sheet the Tick Tables Cover
+
+
+def counter_values(ticks, increment=ANIMATION_INCREMENT):
+    """Returns the values of the float animation counter after 0 to ticks - 1 increments."""
+    values = [0.0]
+    for _ in range(ticks - 1):
+        values.append(values[-1] + increment)
+    return values
+
+
+# Frame Shown After Each Tick of the Float Counter and the Tick It Wraps at for Every Sheet Length
+COUNTER_VALUES = counter_values(int(MAX_CLIP_FRAMES / ANIMATION_INCREMENT) + 2)
+TICK_FRAMES = tuple(int(value) for value in COUNTER_VALUES)
+WRAP_TICKS = tuple(next(tick for tick, value in enumerate(COUNTER_VALUES) if value >= length)
+                   for length in range(MAX_CLIP_FRAMES + 1))
+
+
+class Clip:
+    """A class representing the animation of one sheet.
+    table[tick] is the frame index shown tick ticks after the animation started, for one cycle of the animation.
+    By default the table follows the shared float counter; with ticksPerFrame every frame shows for that many ticks."""
+
+    def __init__(self, frames, ticksPerFrame=None):
+        self.frames = frames
+        if ticksPerFrame is None:
+            self.table = TICK_FRAMES[:WRAP_TICKS[len(frames)]]
+        else:
+            self.table = tuple(tick // ticksPerFrame for tick in range(len(frames) * ticksPerFrame))
+        self.cycle = len(self.table)
+
+    def frame(self, ticks):
+        """Returns the frame index shown the given number of ticks after the animation started."""
+        return self.table[ticks % self.cycle]
+
+    def image(self, ticks):
+        return self.frames[self.table[ticks % self.cycle]]
+
+
+# Clips Made So Far, Kept With the Frames They Were Made for
+clips = {}
+
+
+def clip(frames, ticksPerFrame=None):
+    """Returns the shared clip of a sheet's frames, making it on the first request."""
+    key = (id(frames), ticksPerFrame)
+    entry = clips.get(key)
+    if entry is None or entry[0] is not frames:
+        entry = clips[key] = (frames, Clip(frames, ticksPerFrame))
+    return entry[1]
+
+
+class Animator:
+    """A class representing the shared animation clock and the sprites it animates.
+    A sprite is added with its clip and starts at the current tick; one call to update() sets the image
+    of every added sprite for the current tick, so all of them advance together in one batched pass."""
+
+    def __init__(self):
+        self.tick = 0
+        self.sprites = {}
+
+    def advance(self):
+        self.tick += 1
+
+    def add(self, sprite, clip):
+        self.sprites[sprite] = (clip, self.tick)
+        sprite.image = clip.frames[0]
+
+    def remove(self, sprite):
+        self.sprites.pop(sprite, None)
+
+    def clear(self):
+        self.sprites.clear()
+
+    def frame(self, clip, start=0):
+        """Returns the frame index of a clip that started at the given tick."""
+        return clip.table[(self.tick - start) % clip.cycle]
+
+    def update(self):
+        tick = self.tick
+        for sprite, (clip, start) in self.sprites.items():
+            sprite.image = clip.frames[clip.table[(tick - start) % clip.cycle]]
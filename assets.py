@@ -0,0 +1,241 @@
+import json
+import os
+from collections import OrderedDict
+import pygame as pg
+from settings import FONT_CACHE, TEXT_CACHE_SIZE
+
+"""
+The assets module for the "Leap of Faith: The 100-Floor Trials" game. This module holds a process-wide registry
+that decodes, slices, scales and flips every image sheet only once and hands the same read-only frames to every sprite.
+Once a sheet has been requested, spawning new sprites that use it never touches the disk again.
+Fonts are opened on their first use, and the file each system font name resolves to is cached on disk,
+as building pygame's system font index is the slowest part of opening a font.
+"""
+
+
+def flip(images):
+    """Flips a list of images horizontally."""
+    return [pg.transform.flip(image, True, False) for image in images]
+
+
+def convert(image, alpha=True):
+    """Converts an image to the display format, leaving it untouched when no display is set (headless runs)."""
+    if pg.display.get_surface() is None:
+        return image
+    return image.convert_alpha() if alpha else image.convert()
+
+
+def scaled_size(size, scale):
+    """Returns the size of an image drawn at full resolution on a canvas that is scale times smaller."""
+    return (size[0] // scale, size[1] // scale)
+
+
+def load_image_sheets(img_path, width, height, needScale=False, customScale=False, size=None, scale=1):
+    """Splits an image into multiple sub-images (sprites) based on the given width and height,
+    and optionally scales them, at 1/scale of their full-resolution size."""
+    image = convert(pg.image.load(img_path))
+    image_num = image.get_width() // width
+
+    images = []
+    for i in range(image_num):
+        surface = pg.Surface((width, height), pg.SRCALPHA, depth=32)
+        rect = pg.Rect(i * width, 0, width, height)
+        surface.blit(image, (0, 0), rect)
+        if scale == 1:
+            if needScale:
+                surface = pg.transform.scale2x(surface)
+            elif customScale:
+                surface = pg.transform.scale(surface, size)
+        else:
+            # Scaled straight to the canvas size, e.g. doubled sprites are kept at their art size
+            target = scaled_size((width * 2, height * 2) if needScale else size if customScale
+                                 else (width, height), scale)
+            if target != (width, height):
+                surface = pg.transform.scale(surface, target)
+        images.append(surface)
+    return images
+
+
+def resolve_font(name, cache_path=FONT_CACHE):
+    """Returns the file of a system font, or None for pygame's default font, caching the result on disk."""
+    try:
+        with open(cache_path) as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        paths = {}
+    if name in paths and (paths[name] is None or os.path.exists(paths[name])):
+        return paths[name]
+
+    # Only a name missing from the cache builds the system font index
+    paths[name] = pg.font.match_font(name)
+    with open(cache_path, 'w') as f:
+        json.dump(paths, f, indent=1)
+    return paths[name]
+
+
+class AssetRegistry:
+    """A class representing the shared asset registry.
+    Every sheet or image is keyed by its path and the transformation applied to it,
+    decoded on the first request and cached as a tuple of surfaces. A scale above 1 gives the
+    surfaces for a canvas that many times smaller than the window, at a fraction of the memory.
+    The returned surfaces are shared between all sprites and must be treated as read-only.
+    The collision masks of a sheet are built once per frame and cached next to its frames.
+    Fonts are kept apart from the surfaces and opened once per name and size.
+    Hit, miss, disk load and memory counters are kept to verify that spawning never reloads assets."""
+
+    def __init__(self):
+        self.cache = {}
+        self.masks = {}
+        self.fonts = {}
+        self.font_paths = {}
+        self.hits = 0
+        self.misses = 0
+        self.disk_loads = 0
+
+    def sheet(self, img_path, width, height, needScale=False, customScale=False, size=None, flipped=False,
+              scale=1):
+        """Returns the shared frames of an image sheet, optionally flipped horizontally."""
+        key = ('sheet', img_path, width, height, needScale, customScale, size, flipped, scale)
+        frames = self.cache.get(key)
+        if frames is not None:
+            self.hits += 1
+            return frames
+
+        self.misses += 1
+        if flipped:
+            frames = tuple(flip(self.sheet(
+                img_path, width, height, needScale, customScale, size, scale=scale)))
+        else:
+            self.disk_loads += 1
+            frames = tuple(load_image_sheets(
+                img_path, width, height, needScale, customScale, size, scale))
+        self.cache[key] = frames
+        return frames
+
+    def image(self, img_path, size=None, alpha=True, scale=1):
+        """Returns a shared single image, optionally scaled to the given size."""
+        key = ('image', img_path, size, alpha, scale)
+        frames = self.cache.get(key)
+        if frames is not None:
+            self.hits += 1
+            return frames[0]
+
+        self.misses += 1
+        self.disk_loads += 1
+        image = convert(pg.image.load(img_path), alpha)
+        if scale != 1:
+            image = pg.transform.scale(image, scaled_size(size or image.get_size(), scale))
+        elif size is not None:
+            image = pg.transform.scale(image, size)
+        self.cache[key] = (image,)
+        return image
+
+    def sheet_masks(self, img_path, width, height, needScale=False, customScale=False, size=None, flipped=False):
+        """Returns the shared collision masks of every frame of an image sheet."""
+        key = ('sheet', img_path, width, height, needScale, customScale, size, flipped)
+        masks = self.masks.get(key)
+        if masks is None:
+            frames = self.cache.get(key + (1,))
+            if frames is None:
+                # Masks need the full-resolution frames, which aren't kept when only a smaller canvas is drawn
+                self.disk_loads += 1
+                frames = load_image_sheets(img_path, width, height, needScale, customScale, size)
+                if flipped:
+                    frames = flip(frames)
+            masks = self.masks[key] = tuple(pg.mask.from_surface(frame) for frame in frames)
+        return masks
+
+    def font(self, name, size):
+        """Returns a shared font, resolving the file of the system font only on the first request."""
+        font = self.fonts.get((name, size))
+        if font is None:
+            if name not in self.font_paths:
+                self.font_paths[name] = resolve_font(name)
+            if not pg.font.get_init():
+                pg.font.init()
+            font = self.fonts[(name, size)] = pg.font.Font(
+                self.font_paths[name], size)
+        return font
+
+    def preload(self, key, frames):
+        """Stores frames that were produced elsewhere, e.g. by the sprite atlas, under a registry key."""
+        self.cache[key] = tuple(frames)
+
+    def stats(self):
+        """Returns the hit/miss, disk load and memory counters of the registry."""
+        surfaces = [surface for frames in self.cache.values()
+                    for surface in frames]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_loads': self.disk_loads,
+            'entries': len(self.cache),
+            'surfaces': len(surfaces),
+            'masks': sum(len(masks) for masks in self.masks.values()),
+            'bytes': sum(surface.get_bytesize() * surface.get_width() * surface.get_height()
+                         for surface in surfaces),
+        }
+
+    def clear(self):
+        """Drops every cached surface, mask and font and resets the counters."""
+        self.cache.clear()
+        self.masks.clear()
+        self.fonts.clear()
+        self.hits = 0
+        self.misses = 0
+        self.disk_loads = 0
+
+
+class TextCache:
+    """A class representing the bounded cache of rendered text.
+    Every rendered string is keyed by its text, font, color and antialias flag,
+    so text is only rasterized again when the string actually changes.
+    The least recently used surface is dropped once the cache is full.
+    The returned surfaces are shared and must be treated as read-only."""
+
+    def __init__(self, maxsize=TEXT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, text, font, color, antialias=True):
+        """Returns the rendered surface of a text, rendering it only on the first request."""
+        key = (text, font, color, antialias)
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.cache[key] = surface
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def stats(self):
+        """Returns the hit/miss and eviction counters of the cache."""
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0,
+            'evictions': self.evictions,
+            'entries': len(self.cache),
+        }
+
+    def clear(self):
+        """Drops every cached surface and resets the counters."""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+# Process-wide Registry and Text Cache Instances
+registry = AssetRegistry()
+text_cache = TextCache()
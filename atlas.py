@@ -0,0 +1,217 @@
+import json
+import mmap
+import os
+import subprocess
+import sys
+import threading
+from statistics import median
+import pygame as pg
+from settings import *
+from assets import AssetRegistry
+
+"""
+The atlas module for the "Leap of Faith: The 100-Floor Trials" game. This module bakes every sliced, scaled and
+flipped frame the game uses into one raw pixel file plus a JSON index, and loads them back through a memory map
+with a single blit per frame. The atlas is rebuilt automatically whenever a source PNG is modified.
+Entries are grouped into the startup assets and the sheets of each hero, so a hero's sheets can be loaded lazily,
+and are baked once per canvas scale, so the native canvas loads its smaller frames straight from the atlas too.
+
+Run "python atlas.py" to build the atlas, or "python atlas.py --bench" to compare the time to first frame
+with and without it.
+"""
+
+ATLAS_VERSION = 3
+build_lock = threading.Lock()
+
+
+def request_startup_assets(registry, scale=1):
+    """Requests every surface the game draws before a hero is chosen, for a canvas of the given scale."""
+    # Background, Traps and Walls
+    registry.image(BACKGROUND, alpha=False, scale=scale)
+    registry.image(TOWER_BG, (WIDTH, HEIGHT), alpha=False, scale=scale)
+    registry.sheet(SAW, SAW_WIDTH, SAW_HEIGHT, scale=scale)
+    registry.image(WALL, (WALL_WIDTH, WALL_HEIGHT), alpha=False, scale=scale)
+
+    # HUD
+    for hud_number in HUD_NUMBER:
+        registry.image(hud_number, scale=scale)
+    registry.image(HEARTFULL, scale=scale)
+    registry.image(HEARTEMPTY, scale=scale)
+
+    # Heroes Shown on the Pre-game Screen
+    registry.sheet(HERO_APPEAR, CUTSCENE_WIDTH, CUTSCENE_HEIGHT, True, scale=scale)
+    for img_path in HERO_IDLE.values():
+        registry.sheet(img_path, HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+
+    # Terrains
+    for terrain_type, img_path in TERRAIN.items():
+        if terrain_type in ('conveyor_tile_right', 'conveyor_tile_left'):
+            registry.sheet(img_path, CONVEYOR_WIDTH, CONVEYOR_HEIGHT,
+                           customScale=True, size=(TERRAIN_WIDTH, TERRAIN_HEIGHT),
+                           flipped=terrain_type == 'conveyor_tile_left', scale=scale)
+        else:
+            registry.image(
+                img_path, (TERRAIN_WIDTH, TERRAIN_HEIGHT), alpha=False, scale=scale)
+
+
+def request_hero_assets(registry, heroType, scale=1):
+    """Requests the sheets that are only drawn once the given hero is played, for a canvas of the given scale."""
+    registry.sheet(HERO_IDLE[heroType], HERO_WIDTH, HERO_HEIGHT,
+                   True, flipped=True, scale=scale)
+    for sheets in (HERO_RUN, HERO_FALL, HERO_HIT):
+        registry.sheet(sheets[heroType], HERO_WIDTH, HERO_HEIGHT, True, scale=scale)
+        registry.sheet(sheets[heroType], HERO_WIDTH, HERO_HEIGHT,
+                       True, flipped=True, scale=scale)
+
+
+def load_startup_assets(registry, useAtlas=USE_ATLAS, scale=1):
+    """Loads every surface needed before a hero is chosen, from the atlas if it is used."""
+    if useAtlas:
+        load_atlas(registry, group='startup', scale=scale)
+    request_startup_assets(registry, scale)
+
+
+def load_hero_assets(registry, heroType, useAtlas=USE_ATLAS, scale=1):
+    """Loads the sheets of the given hero, from the atlas if it is used."""
+    if useAtlas:
+        load_atlas(registry, group=heroType, scale=scale)
+    request_hero_assets(registry, heroType, scale)
+
+
+def source_mtimes(registry):
+    """Returns the modification time of every source image held by the registry."""
+    return {key[1]: os.path.getmtime(key[1]) for key in registry.cache}
+
+
+def freeze_key(key):
+    """Turns a registry key read back from JSON into a hashable tuple again."""
+    return tuple(freeze_key(item) if isinstance(item, list) else item for item in key)
+
+
+def is_stale(index_path=ATLAS_INDEX, atlas_path=ATLAS_PATH):
+    """Checks whether the atlas is missing, outdated or built from older source images."""
+    if not (os.path.exists(index_path) and os.path.exists(atlas_path)):
+        return True
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get('version') != ATLAS_VERSION:
+        return True
+    for img_path, mtime in index['sources'].items():
+        if not os.path.exists(img_path) or os.path.getmtime(img_path) != mtime:
+            return True
+    return False
+
+
+def build_atlas(atlas_path=ATLAS_PATH, index_path=ATLAS_INDEX):
+    """Decodes every asset at every canvas scale and writes the raw frames into the atlas file and its index."""
+    registry = AssetRegistry()
+    groups = {}
+    for scale in sorted(set(CANVAS_SCALES.values())):
+        request_startup_assets(registry, scale)
+        for key in registry.cache:
+            groups.setdefault(key, ('startup', scale))
+        for hero_type in HERO_IDLE:
+            request_hero_assets(registry, hero_type, scale)
+            for key in registry.cache:
+                groups.setdefault(key, (hero_type, scale))
+
+    entries = []
+    offset = 0
+    with open(atlas_path, 'wb') as f:
+        for key, frames in registry.cache.items():
+            # Opaque images are stored without alpha so they load exactly as convert() produced them
+            pixel_format = 'RGBA' if frames[0].get_flags() & pg.SRCALPHA else 'RGB'
+            frame_index = []
+            for frame in frames:
+                data = pg.image.tobytes(frame, pixel_format)
+                f.write(data)
+                frame_index.append([offset, frame.get_width(), frame.get_height()])
+                offset += len(data)
+            group, scale = groups[key]
+            entries.append({'key': key, 'group': group, 'scale': scale,
+                            'format': pixel_format, 'frames': frame_index})
+
+    with open(index_path, 'w') as f:
+        json.dump({'version': ATLAS_VERSION, 'sources': source_mtimes(registry),
+                   'entries': entries}, f)
+
+
+def load_atlas(registry, atlas_path=ATLAS_PATH, index_path=ATLAS_INDEX, group=None, scale=1):
+    """Loads the atlas frames of a group, or all of them, for a canvas scale into the registry,
+    rebuilding the atlas first if a source image changed."""
+    # Loader threads may get here at the same time, but only one of them rebuilds
+    with build_lock:
+        if is_stale(index_path, atlas_path):
+            build_atlas(atlas_path, index_path)
+
+    with open(index_path) as f:
+        index = json.load(f)
+
+    with open(atlas_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as atlas:
+            view = memoryview(atlas)
+            for entry in index['entries']:
+                if group is not None and entry['group'] != group or entry['scale'] != scale:
+                    continue
+                pixel_format = entry['format']
+                frames = []
+                for offset, width, height in entry['frames']:
+                    size = width * height * len(pixel_format)
+                    if pixel_format == 'RGBA':
+                        surface = pg.Surface(
+                            (width, height), pg.SRCALPHA, depth=32).convert_alpha()
+                    else:
+                        surface = pg.Surface((width, height)).convert()
+                    # The mapped pixels are wrapped without a copy and blitted once into the new surface
+                    frame_view = view[offset:offset + size]
+                    surface.blit(pg.image.frombuffer(
+                        frame_view, (width, height), pixel_format), (0, 0))
+                    frame_view.release()
+                    frames.append(surface)
+                registry.preload(freeze_key(entry['key']), frames)
+            view.release()
+
+
+def time_to_first_frame(use_atlas):
+    """Starts the game in a fresh process and returns the seconds until the first frame is shown."""
+    script = f'''
+import time
+start = time.perf_counter()
+import pygame as pg
+import LeapOfFaith
+LeapOfFaith.USE_ATLAS = {use_atlas}
+game = LeapOfFaith.Game()
+game.wait_until_loaded()
+game.canvas.blit(game.tower_BG, (0, 0))
+game.display_pregame_hud()
+game.display_pregame_messages()
+game.canvas.present()
+pg.display.update()
+print(time.perf_counter() - start)
+'''
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy')
+    output = subprocess.run([sys.executable, '-c', script], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+
+def benchmark(runs=5):
+    """Prints the median time to first frame with and without the atlas."""
+    if is_stale():
+        pg.display.set_mode((1, 1))
+        build_atlas()
+    for use_atlas in (False, True):
+        times = [time_to_first_frame(use_atlas) for _ in range(runs)]
+        print(f'{"atlas" if use_atlas else "decode"}: '
+              f'median {median(times) * 1000:.1f} ms over {runs} runs')
+
+
+if __name__ == '__main__':
+    pg.init()
+    if '--bench' in sys.argv:
+        benchmark()
+    else:
+        # Building needs a display surface so frames are converted to the screen format
+        pg.display.set_mode((1, 1))
+        build_atlas()
+        print(f'Atlas written to {ATLAS_PATH} and {ATLAS_INDEX}.')
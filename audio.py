@@ -0,0 +1,158 @@
+import hashlib
+import mmap
+import os
+import time
+import pygame as pg
+from settings import *
+
+"""
+The audio module for the "Leap of Faith: The 100-Floor Trials" game. This module holds the audio bank, which decodes
+every sound effect only once: the decoded PCM samples are written to a cache on disk, keyed by a hash of the source
+file and the mixer format, and memory-mapped straight into the mixer on later launches. The bank also reserves a fixed
+pool of mixer channels per effect category, so a burst of spike or break sounds only ever reuses the channels of its
+own category, and the music plays only if its file is actually there.
+
+Run "python audio.py" to compare loading the sounds by decoding them with loading them from the cache.
+"""
+
+
+def file_hash(path):
+    """Returns the SHA-1 hex digest of a file's contents."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ChannelPool:
+    """A class representing the mixer channels reserved for one effect category.
+    A sound plays on the first idle channel of the pool; when all of them are busy,
+    the one that started playing first is cut off, so the pool never takes a channel
+    of another category and never waits for one."""
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.next = 0
+
+    def play(self, sound):
+        for channel in self.channels:
+            if not channel.get_busy():
+                channel.play(sound)
+                return channel
+        channel = self.channels[self.next]
+        self.next = (self.next + 1) % len(self.channels)
+        channel.play(sound)
+        return channel
+
+
+class AudioBank:
+    """A class representing the bank of pre-decoded sound effects.
+    Sounds are kept under a name and belong to one category of SOUND_CHANNELS, whose channels are reserved up front.
+    The cache files hold the raw samples in the mixer's format, so they are only valid for that format, which is part
+    of their name. When the mixer is unavailable, e.g. without an audio device, the bank loads nothing and plays
+    nothing. Cache hit and miss counters are kept to check that later launches skip decoding."""
+
+    def __init__(self, cache_dir=AUDIO_CACHE, channels=SOUND_CHANNELS):
+        self.cache_dir = cache_dir
+        self.sounds = {}
+        self.categories = {}
+        self.pools = {}
+        self.music = False
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self.enabled = pg.mixer.get_init() is not None
+        if self.enabled:
+            # The reserved channels come first, any others are left to Sound.play()
+            reserved = sum(channels.values())
+            pg.mixer.set_num_channels(max(pg.mixer.get_num_channels(), reserved))
+            pg.mixer.set_reserved(reserved)
+            first = 0
+            for category, count in channels.items():
+                self.pools[category] = ChannelPool(
+                    [pg.mixer.Channel(i) for i in range(first, first + count)])
+                first += count
+
+    def cache_path(self, path, digest):
+        frequency, size, channels = pg.mixer.get_init()
+        return os.path.join(self.cache_dir, f'{os.path.basename(path)}.{digest[:16]}.{frequency}_{size}_{channels}.pcm')
+
+    def decode(self, path, cache_path):
+        """Decodes a sound file and writes its samples to the cache, replacing older versions of the same file."""
+        sound = pg.mixer.Sound(path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        prefix = os.path.basename(path) + '.'
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.cache_dir, name))
+        # Written under a temporary name first, so a launch that stops midway never leaves a truncated cache file
+        with open(cache_path + '.tmp', 'wb') as f:
+            f.write(sound.get_raw())
+        os.replace(cache_path + '.tmp', cache_path)
+        return sound
+
+    def load(self, name, path, category):
+        """Loads a sound under a name from the cache, decoding it only if the source file changed, and returns it."""
+        if not self.enabled:
+            return None
+        cache_path = self.cache_path(path, file_hash(path))
+        if os.path.exists(cache_path):
+            self.hits += 1
+            with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as samples:
+                sound = pg.mixer.Sound(buffer=samples)
+                self.bytes += len(samples)
+        else:
+            self.misses += 1
+            sound = self.decode(path, cache_path)
+            self.bytes += os.path.getsize(cache_path)
+        self.sounds[name] = sound
+        self.categories[name] = category
+        return sound
+
+    def load_music(self, path):
+        """Loads the background music if its file exists, and returns whether it did."""
+        if not self.enabled or not os.path.exists(path):
+            print(f'No background music at {path}, playing without it')
+            return False
+        pg.mixer.music.load(path)
+        self.music = True
+        return True
+
+    def play_music(self, volume):
+        if self.music:
+            pg.mixer.music.play(loops=-1)
+            pg.mixer.music.set_volume(volume)
+
+    def play(self, name):
+        """Plays a loaded sound on a channel of its category."""
+        sound = self.sounds.get(name)
+        if sound is not None:
+            self.pools[self.categories[name]].play(sound)
+
+    def stats(self):
+        """Returns the cache hit and miss counters and the bytes of decoded samples loaded."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'sounds': len(self.sounds),
+            'bytes': self.bytes,
+        }
+
+
+def benchmark(runs=5):
+    """Prints the median time to load every sound effect by decoding it and from the warm cache."""
+    bank = AudioBank()
+    for name, (path, category) in SOUND_EFFECTS.items():
+        bank.load(name, path, category)
+    for label, load in (('decode', lambda name, path, category: pg.mixer.Sound(path)),
+                        ('cache', bank.load)):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            for name, (path, category) in SOUND_EFFECTS.items():
+                load(name, path, category)
+            times.append(time.perf_counter() - start)
+        print(f'{label}: median {sorted(times)[len(times) // 2] * 1000:.1f} ms over {runs} runs')
+
+
+if __name__ == '__main__':
+    pg.mixer.init()
+    benchmark()
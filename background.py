@@ -0,0 +1,168 @@
+import time
+import pygame as pg
+from settings import *
+from assets import convert, registry
+
+"""
+The background module for the "Leap of Faith: The 100-Floor Trials" game. This module pre-composites the
+in-game background: the tiled backdrop and the saw row are baked into one screen-sized layer, and the walls
+are stacked into one pre-built strip that scrolls with a single offset blit per side.
+The saw row is only redrawn when the saw animation moves on to its next frame.
+
+Run "python background.py" to compare the blits per frame and the drawing time of the baked layer
+with those of drawing every tile separately.
+"""
+
+
+class BackgroundLayer:
+    """A class representing the pre-composited game background.
+    The backdrop tiles never change, so they are blitted into a layer once. The saws are drawn into
+    the same layer on top of the backdrop and refreshed only when their frame changes. Each frame then
+    costs one blit for the layer and one offset blit of the wall strip per side.
+    With a scale above 1 the layer is built for a canvas that many times smaller, from images
+    loaded at that size, and drawn at window positions divided by the scale.
+    A blit counter is kept to compare it against drawing every tile separately."""
+
+    def __init__(self, background, saw, wall, scale=1):
+        self.saw = saw
+        self.saw_index = None
+        self.scale = scale
+        self.blits = 0
+        width, height = WIDTH // scale, HEIGHT // scale
+
+        # Bake Background Tiles
+        self.tiles = convert(pg.Surface((width, height)), alpha=False)
+        for x in range(0, width, background.get_width()):
+            for y in range(0, height, background.get_height()):
+                self.tiles.blit(background, (x, y))
+        self.layer = self.tiles.copy()
+        self.flat_layer = None
+        self.flat_index = None
+        self.flat_color = pg.transform.average_color(self.tiles)
+        self.saw_y = -SAW_HEIGHT // 2 // scale
+        self.saw_row = pg.Rect(WALL_WIDTH // scale, 0, (WIDTH - WALL_WIDTH * 2) // scale,
+                               saw[0].get_height() + self.saw_y)
+
+        # Build Wall Strip, One Wall Taller Than the Screen to Cover the Scrolling Offset
+        self.wall_strip = convert(pg.Surface(
+            (wall.get_width(), (NUM_WALL + 1) * wall.get_height())), alpha=False)
+        for j in range(NUM_WALL + 1):
+            self.wall_strip.blit(wall, (0, j * wall.get_height()))
+
+    def draw_saws(self, saw_index):
+        """Redraws the saw row of the layer with the given saw frame."""
+        self.layer.blit(self.tiles, self.saw_row, self.saw_row)
+        for i in range(NUM_SAW):
+            x_pos = i * (SAW_SPACING + SAW_WIDTH)
+            self.layer.blit(self.saw[saw_index],
+                            ((x_pos + WALL_WIDTH) / self.scale, self.saw_y))
+        self.blits += NUM_SAW + 1
+        self.saw_index = saw_index
+
+    def draw(self, screen, saw_index, wall_offset):
+        """Draws the background with the given saw frame and wall offset onto the screen,
+        returning the regions that differ from the previous frame in window coordinates."""
+        changed = []
+        if saw_index != self.saw_index:
+            self.draw_saws(saw_index)
+            changed.append(self.saw_row)
+        screen.blit(self.layer, (0, 0))
+
+        # Draw Walls
+        visible_wall = pg.Rect(0, -wall_offset // self.scale,
+                               self.wall_strip.get_width(), HEIGHT // self.scale)
+        changed.append(screen.blit(self.wall_strip, (0, 0), visible_wall))
+        changed.append(screen.blit(
+            self.wall_strip, ((WIDTH - WALL_WIDTH) // self.scale, 0), visible_wall))
+        self.blits += 3
+        return self.to_window(changed)
+
+    def draw_flat(self, screen, saw_index):
+        """Draws the cheap background of the flat quality level, the backdrop in its average color
+        with the saws and unscrolled walls baked in, returning the regions that differ from the previous frame.
+        Nothing else changes while the saw frame stays, so switching to it needs a whole screen update."""
+        changed = []
+        if self.flat_layer is None:
+            self.flat_layer = self.layer.copy()
+            self.flat_layer.fill(self.flat_color)
+            self.flat_layer.blit(self.wall_strip, (0, 0))
+            self.flat_layer.blit(self.wall_strip, ((WIDTH - WALL_WIDTH) // self.scale, 0))
+        if saw_index != self.flat_index:
+            self.flat_layer.fill(self.flat_color, self.saw_row)
+            for i in range(NUM_SAW):
+                x_pos = i * (SAW_SPACING + SAW_WIDTH)
+                self.flat_layer.blit(self.saw[saw_index], ((x_pos + WALL_WIDTH) / self.scale, self.saw_y))
+            self.blits += NUM_SAW
+            self.flat_index = saw_index
+            changed.append(self.saw_row)
+        screen.blit(self.flat_layer, (0, 0))
+        self.blits += 1
+        return self.to_window(changed)
+
+    def to_window(self, rects):
+        """Scales rects on the layer up to window coordinates."""
+        scale = self.scale
+        if scale != 1:
+            rects = [pg.Rect(rect.x * scale, rect.y * scale, rect.w * scale, rect.h * scale) for rect in rects]
+        return rects
+
+
+def draw_tiles(screen, background, saw, wall, saw_index, wall_offset):
+    """Draws the background tile by tile as the game did before the layer, returning the number of blits."""
+    for x in range(0, WIDTH, BG_WIDTH):
+        for y in range(0, HEIGHT, BG_HEIGHT):
+            screen.blit(background, (x, y))
+    for i in range(NUM_SAW):
+        x_pos = i * (SAW_SPACING + SAW_WIDTH)
+        screen.blit(saw[saw_index], (x_pos + WALL_WIDTH, -SAW_HEIGHT // 2))
+    for j in range(NUM_WALL + 1):
+        y_pos = wall_offset + j * WALL_HEIGHT
+        screen.blit(wall, (0, y_pos))
+        screen.blit(wall, (WIDTH - WALL_WIDTH, y_pos))
+    return len(range(0, WIDTH, BG_WIDTH)) * len(range(0, HEIGHT, BG_HEIGHT)) + \
+        NUM_SAW + (NUM_WALL + 1) * 2
+
+
+def benchmark(frames=600):
+    """Draws the same frames both ways, checks they look identical and prints blits and time per frame."""
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    background = registry.image(BACKGROUND, alpha=False)
+    saw = registry.sheet(SAW, SAW_WIDTH, SAW_HEIGHT)
+    wall = registry.image(WALL, (WALL_WIDTH, WALL_HEIGHT), alpha=False)
+    reference = pg.Surface((WIDTH, HEIGHT))
+    layer = BackgroundLayer(background, saw, wall)
+
+    # Follow the saw frame and wall offset exactly as the game advances them
+    states = []
+    saw_index = wall_offset = 0
+    for frame in range(1, frames + 1):
+        states.append((saw_index, wall_offset))
+        if frame % SAW_SPEED == 0:
+            saw_index = (saw_index + 1) % len(saw)
+        wall_offset -= TERRAIN_SPEED
+        if wall_offset <= -WALL_HEIGHT:
+            wall_offset = 0
+
+    for saw_index, wall_offset in states[:len(saw) * SAW_SPEED]:
+        draw_tiles(reference, background, saw, wall, saw_index, wall_offset)
+        layer.draw(screen, saw_index, wall_offset)
+        assert pg.image.tobytes(reference, 'RGB') == pg.image.tobytes(screen, 'RGB'), \
+            f'layer differs at saw frame {saw_index}, wall offset {wall_offset}'
+
+    start = time.perf_counter()
+    blits = sum(draw_tiles(screen, background, saw, wall, *state)
+                for state in states)
+    tiles_time = time.perf_counter() - start
+
+    layer = BackgroundLayer(background, saw, wall)
+    start = time.perf_counter()
+    for state in states:
+        layer.draw(screen, *state)
+    layer_time = time.perf_counter() - start
+
+    print(f'tiles: {blits / frames:.1f} blits, {tiles_time / frames * 1000:.3f} ms per frame')
+    print(f'layer: {layer.blits / frames:.1f} blits, {layer_time / frames * 1000:.3f} ms per frame')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,387 @@
+import argparse
+import time
+from random import Random
+import numpy as np
+import pygame as pg
+from settings import *
+from replay import CAUSES, HERO_TYPES
+from simulation import TERRAIN_TYPES, Simulation, heuristic_action, hero_masks, terrain_masks
+from levels import LevelGenerator
+from animation import TICK_FRAMES, WRAP_TICKS
+from assets import registry
+
+"""
+The batched environment module for the "Leap of Faith: The 100-Floor Trials" game. This module runs many games
+at once, holding every game as rows of NumPy arrays: terrain positions and types, hero position, health,
+fall state and level. One call to step(actions) advances all games by one frame in a single vectorized pass that
+follows the same rules as the Simulation class, including pixel-exact mask collision.
+
+Run "python batch_env.py" to measure the throughput, or "python batch_env.py --check" to compare the batched
+rules against the Simulation class step by step. Requires NumPy.
+"""
+
+STATES = ('idle', 'run', 'fall', 'hit')
+DIRECTIONS = ('left', 'right')
+MAX_TERRAINS = 12  # Terrain Slots per Game, at Most Seven Tiles Are on Screen at Once
+
+TYPE_INDEX = {terrain_type: i for i, terrain_type in enumerate(TERRAIN_TYPES)}
+SPIKE, HEAL, EMPTY = TYPE_INDEX['spike_tile'], TYPE_INDEX['heal_tile'], TYPE_INDEX['empty_tile']
+CONVEYOR_LEFT, CONVEYOR_RIGHT = TYPE_INDEX['conveyor_tile_left'], TYPE_INDEX['conveyor_tile_right']
+HERO_SIZE = HERO_WIDTH * 2
+TICK_FRAME_ARRAY = np.array(TICK_FRAMES, np.int32)
+
+
+def mask_array(mask):
+    """Converts a pygame mask into a boolean array indexed by [y, x]."""
+    surface = mask.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+    return pg.surfarray.array_alpha(surface).T > 0
+
+
+def summed_area(arrays):
+    """Returns the summed-area tables of a stack of boolean masks, so any rectangle can be counted with four lookups."""
+    table = np.zeros((len(arrays), arrays.shape[1] + 1, arrays.shape[2] + 1), np.int32)
+    table[:, 1:, 1:] = arrays.cumsum(1).cumsum(2)
+    return table
+
+
+class HeroTables:
+    """Lookup tables for one hero type: the summed-area table of every frame mask,
+    the first table row of each animation state and direction, and the tick each state's animation wraps at."""
+
+    def __init__(self, heroType):
+        masks = hero_masks(heroType)
+        frames = []
+        self.offsets = np.zeros((len(STATES), len(DIRECTIONS)), np.int32)
+        self.wrap_ticks = np.zeros(len(STATES), np.int32)
+        for s, state in enumerate(STATES):
+            for d, direction in enumerate(DIRECTIONS):
+                self.offsets[s, d] = len(frames)
+                frames.extend(mask_array(mask) for mask in masks[(state, direction)])
+            self.wrap_ticks[s] = WRAP_TICKS[len(masks[(state, 'left')])]
+        self.sat = summed_area(np.array(frames))
+        self.appear_ticks = WRAP_TICKS[len(registry.sheet(
+            HERO_APPEAR, CUTSCENE_WIDTH, CUTSCENE_HEIGHT, True))]
+
+
+def conveyor_spans():
+    """Returns the first and past-the-end opaque column of every row of both conveyor masks."""
+    masks = terrain_masks()
+    lefts = np.zeros((len(TERRAIN_TYPES), TERRAIN_HEIGHT), np.int32)
+    rights = np.zeros((len(TERRAIN_TYPES), TERRAIN_HEIGHT), np.int32)
+    for terrain_type in ('conveyor_tile_left', 'conveyor_tile_right'):
+        for y, row in enumerate(mask_array(masks[terrain_type])):
+            columns = np.nonzero(row)[0]
+            if len(columns):
+                lefts[TYPE_INDEX[terrain_type], y] = columns[0]
+                rights[TYPE_INDEX[terrain_type], y] = columns[-1] + 1
+    return lefts, rights
+
+
+class BatchEnv:
+    """A batch of N independent games of one hero type stepped together with NumPy.
+    Terrain tiles live in MAX_TERRAINS slots per game; a type of -1 marks a free slot and
+    the spawn order of each slot keeps the collision order of the Simulation class.
+    Terrain spawns use one seeded LevelGenerator per game, exactly like Simulation, so game i
+    of a batch matches Simulation(heroType, seeds[i]) given the same actions."""
+
+    def __init__(self, num, heroType='MaskDude', seeds=None):
+        self.num = num
+        self.hero_type = heroType
+        self.tables = HeroTables(heroType)
+        self.conveyor_left, self.conveyor_right = conveyor_spans()
+        self.levels = [LevelGenerator() for _ in range(num)]
+
+        # Terrain Arrays
+        self.terrain_x = np.zeros((num, MAX_TERRAINS), np.int32)
+        self.terrain_y = np.zeros((num, MAX_TERRAINS), np.int32)
+        self.terrain_type = np.full((num, MAX_TERRAINS), -1, np.int32)
+        self.terrain_order = np.zeros((num, MAX_TERRAINS), np.int64)
+        self.terrain_used = np.zeros((num, MAX_TERRAINS), bool)
+        self.trigger_tick = np.full((num, MAX_TERRAINS), -1, np.int64)
+        self.spawn_count = np.zeros(num, np.int64)
+
+        # Hero Arrays
+        self.hero_x = np.zeros(num, np.int32)
+        self.hero_y = np.zeros(num, np.int32)
+        self.health = np.zeros(num, np.int32)
+        self.animation_tick = np.zeros(num, np.int32)
+        self.cutscene_played = np.zeros(num, bool)
+        self.direction = np.zeros(num, np.int32)
+        self.run = np.zeros(num, bool)
+        self.fall = np.zeros(num, bool)
+        self.hit = np.zeros(num, bool)
+        self.state = np.zeros(num, np.int32)
+        self.frame = np.zeros(num, np.int32)
+
+        # Game Arrays
+        self.tick = np.zeros(num, np.int64)
+        self.fall_dist = np.zeros(num, np.int64)
+        self.hero_prevPos = np.zeros(num, np.int64)
+        self.level = np.zeros(num, np.int32)
+        self.done = np.zeros(num, bool)
+        self.cause = np.zeros(num, np.int32)
+        self.damage = np.zeros(num, np.int32)
+        self.heal = np.zeros(num, np.int32)
+        self.broken = np.zeros(num, np.int32)
+
+        self.seeds = np.zeros(num, np.int64)
+        self.reset(seeds=seeds)
+
+    def reset(self, games=None, seeds=None):
+        """Restarts the given games, as indices or a boolean mask (all by default), drawing fresh seeds unless given."""
+        games = np.arange(self.num) if games is None else np.asarray(games)
+        if games.dtype == bool:
+            games = np.flatnonzero(games)
+        if seeds is None:
+            seeds = [Random().randrange(2 ** 32) for _ in games]
+        for i, seed in zip(games, seeds):
+            self.seeds[i] = seed
+            self.levels[i].reset(seed)
+
+        self.terrain_type[games] = -1
+        self.terrain_used[games] = False
+        self.trigger_tick[games] = -1
+        self.terrain_type[games, 0] = TYPE_INDEX['common_tile']
+        self.terrain_x[games, 0] = WIDTH // 2 - TERRAIN_WIDTH // 2
+        self.terrain_y[games, 0] = HEIGHT
+        self.terrain_order[games, 0] = 0
+        self.spawn_count[games] = 1
+
+        # The appear cutscene is twice the cutscene size, standing on the hero's start position
+        self.hero_x[games] = HERO_X - CUTSCENE_WIDTH
+        self.hero_y[games] = HERO_Y - CUTSCENE_HEIGHT * 2
+        self.health[games] = MAX_HEALTH
+        self.animation_tick[games] = 0
+        self.cutscene_played[games] = False
+        self.direction[games] = DIRECTIONS.index('left')
+        self.run[games] = self.fall[games] = self.hit[games] = False
+        self.state[games] = self.frame[games] = 0
+
+        self.tick[games] = 0
+        self.fall_dist[games] = 0
+        self.hero_prevPos[games] = HERO_Y
+        self.level[games] = TOP_LEVEL
+        self.done[games] = False
+        self.cause[games] = 0
+
+    def spawn_terrain(self, games):
+        slots = np.argmax(self.terrain_type[games] < 0, axis=1)
+        if not (self.terrain_type[games, slots] < 0).all():
+            raise RuntimeError(f'More than {MAX_TERRAINS} terrains in one game')
+        for i, slot in zip(games, slots):
+            terrain_type, x = self.levels[i].next_spawn()
+            self.terrain_type[i, slot] = TYPE_INDEX[terrain_type]
+            self.terrain_x[i, slot] = x - TERRAIN_WIDTH // 2
+        self.terrain_y[games, slots] = HEIGHT
+        self.terrain_used[games, slots] = False
+        self.trigger_tick[games, slots] = -1
+        self.terrain_order[games, slots] = self.spawn_count[games]
+        self.spawn_count[games] += 1
+
+    def die(self, games, cause):
+        games = games & ~self.done
+        self.done |= games
+        self.cause[games] = CAUSES.index(cause)
+
+    def overlaps(self, games):
+        """Returns an (N, MAX_TERRAINS) array telling which terrains the visible hero pixels overlap."""
+        tables = self.tables
+        hx, hy = self.hero_x[:, None], self.hero_y[:, None]
+        tx, ty, types = self.terrain_x, self.terrain_y, self.terrain_type
+        x0, x1 = np.maximum(hx, tx), np.minimum(hx + HERO_SIZE, tx + TERRAIN_WIDTH)
+        y0, y1 = np.maximum(hy, ty), np.minimum(hy + HERO_SIZE, ty + TERRAIN_HEIGHT)
+        touching = (x1 > x0) & (y1 > y0) & (types >= 0) & games[:, None]
+
+        frames = tables.offsets[self.state, self.direction] + self.frame
+        overlap = np.zeros(touching.shape, bool)
+
+        # Full tiles overlap when the hero mask has any pixel inside the clipped rectangle
+        full = touching & (types != CONVEYOR_LEFT) & (types != CONVEYOR_RIGHT)
+        g, t = np.nonzero(full)
+        f, ox, oy = frames[g], self.hero_x[g], self.hero_y[g]
+        ya, yb, xa, xb = y0[g, t] - oy, y1[g, t] - oy, x0[g, t] - ox, x1[g, t] - ox
+        sat = tables.sat
+        overlap[g, t] = (sat[f, yb, xb] - sat[f, ya, xb] - sat[f, yb, xa] + sat[f, ya, xa]) > 0
+
+        # Conveyor masks are one opaque span per row, checked row by row
+        g, t = np.nonzero(touching & ~full)
+        f, ox, oy = frames[g], self.hero_x[g], self.hero_y[g]
+        ctype, cx, cy = types[g, t], tx[g, t], ty[g, t]
+        hits = np.zeros(len(g), bool)
+        for row in range(TERRAIN_HEIGHT):
+            ry = cy + row - oy
+            xa = np.maximum(cx + self.conveyor_left[ctype, row], ox) - ox
+            xb = np.minimum(cx + self.conveyor_right[ctype, row], ox + HERO_SIZE) - ox
+            valid = (ry >= 0) & (ry < HERO_SIZE) & (xb > xa)
+            ry, xa, xb = np.clip(ry, 0, HERO_SIZE - 1), np.clip(xa, 0, HERO_SIZE), np.clip(xb, 0, HERO_SIZE)
+            count = sat[f, ry + 1, xb] - sat[f, ry, xb] - sat[f, ry + 1, xa] + sat[f, ry, xa]
+            hits |= valid & (count > 0)
+        overlap[g, t] = hits
+        return overlap
+
+    def collision(self, games):
+        overlap = self.overlaps(games)
+        order = np.where(overlap, self.terrain_order, np.iinfo(np.int64).max)
+        slot = np.argmin(order, axis=1)
+        rows = np.arange(self.num)
+        collided = overlap[rows, slot]
+        tx, ty = self.terrain_x[rows, slot], self.terrain_y[rows, slot]
+        types, used = self.terrain_type[rows, slot], self.terrain_used[rows, slot]
+
+        # Landing on top of the terrain
+        top = collided & (self.hero_y + HERO_SIZE <= ty + COLLISION_THRESHOLD)
+        self.hero_y[top] = ty[top] - HERO_SIZE
+        self.fall[games & ~collided] = True
+        self.fall[top] = False
+
+        damage = top & (types == SPIKE) & ~used
+        self.hit |= damage
+        self.health -= damage
+        self.damage += damage
+        self.die(damage & (self.health <= 0), 'spike')
+
+        heal = top & (types == HEAL) & ~used
+        healed = heal & (self.health < MAX_HEALTH)
+        self.health += healed
+        self.heal += healed
+
+        trigger = top & (types == EMPTY) & ~used
+        self.trigger_tick[rows[trigger], slot[trigger]] = self.tick[trigger]
+        self.terrain_used[rows, slot] |= damage | heal | trigger
+
+        self.hero_x -= CONVEYOR_SPEED * (top & (types == CONVEYOR_LEFT))
+        self.hero_x += CONVEYOR_SPEED * (top & (types == CONVEYOR_RIGHT))
+
+        # Hitting the sides of the terrain
+        side = collided & ~top
+        left = side & (self.hero_x < tx)
+        right = side & ~left & (self.hero_x + HERO_SIZE > tx + TERRAIN_WIDTH)
+        self.hero_x[left] = tx[left] - HERO_SIZE
+        self.hero_x[right] = tx[right] + TERRAIN_WIDTH
+        self.fall[side] = True
+
+    def step(self, actions):
+        """Advances every unfinished game by one frame with its action and returns the done flags."""
+        actions = np.broadcast_to(np.asarray(actions), (self.num,))
+        games = ~self.done
+        self.damage[:] = self.heal[:] = self.broken[:] = 0
+        self.tick += games
+
+        # Spawn Terrains
+        spawning = np.flatnonzero(games & (self.tick % TERRAIN_SPAWN_TICKS == 0))
+        if len(spawning):
+            self.spawn_terrain(spawning)
+
+        # Update Terrains
+        self.terrain_y -= TERRAIN_SPEED * games[:, None]
+        self.terrain_type[self.terrain_y <= -TERRAIN_HEIGHT] = -1
+
+        # Update Hero
+        self.animation_tick += games
+        appearing = games & ~self.cutscene_played
+        playing = games & self.cutscene_played
+
+        appeared = appearing & (self.animation_tick >= self.tables.appear_ticks)
+        self.animation_tick[appeared] = 0
+        self.cutscene_played |= appeared
+        self.hero_x[appeared] = HERO_X - HERO_SIZE // 2
+        self.hero_y[appeared] = HERO_Y - HERO_SIZE
+        self.state[appearing] = STATES.index('idle')
+        self.frame[appearing] = TICK_FRAME_ARRAY[self.animation_tick[appearing]]
+
+        top = self.hero_y
+        dead = playing & ((top <= SAW_HEIGHT // 3) | (top >= HEIGHT))
+        self.health[dead] = 0
+        self.die(playing & (top <= SAW_HEIGHT // 3), 'saw')
+        self.die(playing & (top >= HEIGHT), 'fall')
+
+        self.hero_y += FALL_SPEED * (playing & self.fall)
+
+        move_left = playing & ((actions & ACTION_LEFT) > 0) & (
+            self.hero_x - MOVING_SPEED >= WALL_WIDTH)
+        move_right = playing & ~move_left & ((actions & ACTION_RIGHT) > 0) & (
+            self.hero_x + HERO_SIZE + MOVING_SPEED <= WIDTH - WALL_WIDTH)
+        self.hero_x += MOVING_SPEED * (move_right.astype(np.int32) - move_left)
+        self.run[playing] = (move_left | move_right)[playing]
+        self.direction[move_left] = DIRECTIONS.index('left')
+        self.direction[move_right] = DIRECTIONS.index('right')
+
+        state = np.where(self.hit, 3, np.where(self.fall, 2, np.where(self.run, 1, 0)))
+        wrapped = playing & (self.animation_tick >= self.tables.wrap_ticks[state])
+        self.hit[wrapped & (state == 3)] = False
+        self.animation_tick[wrapped] = 0
+        self.state[playing] = state[playing]
+        self.frame[playing] = TICK_FRAME_ARRAY[self.animation_tick[playing]]
+
+        # Perform Collision Detection and Calculate Falling Distance
+        landed = games & self.cutscene_played
+        self.collision(landed)
+        bottom = self.hero_y + HERO_SIZE
+        self.fall_dist += np.maximum(bottom - self.hero_prevPos, 0) * landed
+        self.hero_prevPos[landed] = bottom[landed]
+
+        breaking = landed[:, None] & (self.trigger_tick >= 0) & (
+            self.tick[:, None] - self.trigger_tick >= EMPTY_TILE_TRIGGER_TICKS)
+        self.broken += (breaking & (self.terrain_type >= 0)).sum(axis=1)
+        self.terrain_type[breaking] = -1
+        self.trigger_tick[breaking] = -1
+
+        # Update Level
+        self.level[games] = (TOP_LEVEL - self.fall_dist // HEIGHT)[games]
+        self.die(games & (self.level == 0), 'win')
+        return self.done
+
+
+def check_against_simulation(num=64, steps=3000, heroType='MaskDude', seed=0):
+    """Steps a batch and one Simulation per game with the same seeds and actions,
+    and raises an AssertionError at the first step where any game differs.
+    Most games follow the heuristic player so runs reach spikes, heals, conveyors and empty tiles;
+    a random action is mixed in now and then."""
+    rng = np.random.default_rng(seed)
+    seeds = [int(s) for s in rng.integers(0, 2 ** 32, num)]
+    env = BatchEnv(num, heroType, seeds)
+    simulations = [Simulation(heroType, s) for s in seeds]
+    for tick in range(steps):
+        action = np.array([heuristic_action(simulation) for simulation in simulations])
+        noise = rng.random(num) < 0.05
+        action = np.where(noise, rng.integers(0, 4, num), action)
+        env.step(action)
+        for i, simulation in enumerate(simulations):
+            simulation.step(int(action[i]))
+            hero = simulation.hero
+            expected = (hero.rect.x, hero.rect.y, hero.health, hero.fall, hero.hit,
+                        simulation.fall_dist, simulation.level, simulation.done, simulation.cause,
+                        sorted((t.rect.x, t.rect.y, t.type) for t in simulation.terrains))
+            live = env.terrain_type[i] >= 0
+            actual = (env.hero_x[i], env.hero_y[i], env.health[i], env.fall[i], env.hit[i],
+                      env.fall_dist[i], env.level[i], env.done[i], CAUSES[env.cause[i]],
+                      sorted(zip(env.terrain_x[i][live], env.terrain_y[i][live],
+                                 (TERRAIN_TYPES[t] for t in env.terrain_type[i][live]))))
+            assert expected == actual, f'game {i} differs at step {tick + 1}:\n{expected}\n{actual}'
+        if env.done.all():
+            break
+    return tick + 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batched Leap of Faith environment.')
+    parser.add_argument('--check', action='store_true',
+                        help='compare the batched rules against the Simulation class')
+    parser.add_argument('--games', type=int, default=1024, help='number of games in the batch')
+    parser.add_argument('--steps', type=int, default=2000, help='number of steps to run')
+    args = parser.parse_args()
+
+    if args.check:
+        for heroType in HERO_TYPES:
+            steps = check_against_simulation(heroType=heroType)
+            print(f'{heroType}: batch matches Simulation over {steps} steps')
+    else:
+        env = BatchEnv(args.games)
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            env.step(rng.integers(0, 4, args.games))
+            env.reset(env.done)
+        elapsed = time.perf_counter() - start
+        print(f'{args.games * args.steps / elapsed:.0f} game steps per second '
+              f'({args.games} games, {args.steps} steps)')
@@ -0,0 +1,202 @@
+import os
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from array import array
+import pygame as pg
+from settings import *
+import LeapOfFaith
+from replay import HERO_TYPES
+from simulation import TERRAIN_TYPES, heuristic_action
+
+"""
+The benchmark module for the "Leap of Faith: The 100-Floor Trials" game. This module runs the whole game loop,
+drawing included, headlessly on the SDL dummy drivers through scripted scenarios with fixed seeds, and reports
+frames per second, frame time percentiles and allocations for each of them.
+
+The scenarios are the normal terrain density, ten times the spawn density, a long descent through all 100 floors
+and a run that lands on every tile type. The scripted player is the simulation's heuristic player; in the descent
+and tile scenarios it is kept alive, so the runs are long enough to cover the whole tower.
+
+Run "python benchmark.py --save" to record a baseline, and "python benchmark.py" to compare against it; the run
+fails when a scenario's frame rate drops or its p99 frame time rises by more than the threshold.
+"""
+
+BASELINE = 'benchmark_baseline.json'
+NOISE_MS = 0.5  # Frame Time Jitter Allowed on Top of the Threshold, as Sub-millisecond p99s Are Noisy
+SEEDS = range(1, 1000)
+SCENARIOS = {
+    'normal': {'spawn_ticks': TERRAIN_SPAWN_TICKS, 'frames': 3000},
+    'dense': {'spawn_ticks': max(1, TERRAIN_SPAWN_TICKS // 10), 'frames': 3000},
+    'descent': {'spawn_ticks': TERRAIN_SPAWN_TICKS, 'frames': 40000, 'keep_alive': True, 'until': 'win'},
+    'all_tiles': {'spawn_ticks': TERRAIN_SPAWN_TICKS, 'frames': 20000, 'keep_alive': True, 'until': 'all_tiles'},
+}
+
+
+def keep_alive(simulation):
+    """Keeps the scripted hero in the tower: full health, wrapped back to the top when it falls out
+    and moved away from the saws when a tile carries it up."""
+    hero = simulation.hero
+    if not hero.cutscene_played:
+        return
+    hero.health = MAX_HEALTH
+    if hero.rect.top >= HEIGHT - FALL_SPEED:
+        hero.rect.top = SAW_HEIGHT
+        simulation.hero_prevPos = hero.rect.bottom
+    elif hero.rect.top <= SAW_HEIGHT // 3 + TERRAIN_SPEED:
+        hero.rect.top = HEIGHT // 2
+        simulation.hero_prevPos = hero.rect.bottom
+
+
+def scripted_actions(game, scenario):
+    """Yields the heuristic player's action for every step of the game's current simulation."""
+    while True:
+        if scenario.get('keep_alive'):
+            keep_alive(game.simulation)
+        yield heuristic_action(game.simulation)
+
+
+def standing_type(simulation):
+    """Returns the type of the tile the hero stands on, or None."""
+    hero = simulation.hero
+    if hero.fall or not hero.cutscene_played:
+        return None
+    for terrain in simulation.nearby_terrains(hero.rect.inflate(0, 2)):
+        if terrain.rect.top == hero.rect.bottom and terrain.rect.left < hero.rect.right \
+                and terrain.rect.right > hero.rect.left:
+            return terrain.type
+    return None
+
+
+def run_scenario(game, scenario, trace_memory=False):
+    """Plays a scenario from its first seed and returns its frame times and counters."""
+    seeds = iter(SEEDS)
+    runs = 0
+    touched = set()
+    # Frame times go into a preallocated array, so they don't show up as allocations
+    frame_times = array('d', bytes(8 * scenario['frames']))
+    frames = 0
+    gc.collect()
+    collections = sum(stats['collections'] for stats in gc.get_stats())
+    if trace_memory:
+        tracemalloc.start()
+
+    for _ in range(scenario['frames']):
+        if game.simulation is None or game.simulation.done:
+            # Restart at once instead of waiting on the game-over screen
+            pg.event.clear()
+            game.reset_game(HERO_TYPES[runs % len(HERO_TYPES)], next(seeds), scenario['spawn_ticks'])
+            game.replay_actions = scripted_actions(game, scenario)
+            runs += 1
+
+        start = time.perf_counter()
+        game.run_frame()
+        frame_times[frames] = time.perf_counter() - start
+        frames += 1
+
+        touched.add(standing_type(game.simulation))
+        if scenario.get('until') == 'win' and game.simulation.cause == 'win':
+            break
+        if scenario.get('until') == 'all_tiles' and touched.issuperset(TERRAIN_TYPES):
+            break
+
+    result = {
+        'frames': frames,
+        'runs': runs,
+        'lowest_level': game.simulation.level,
+        'tile_types': sorted(touched - {None}),
+        'gc_collections': sum(stats['collections'] for stats in gc.get_stats()) - collections,
+    }
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result.update({'net_alloc_kib': current / 1024, 'peak_alloc_kib': peak / 1024})
+    return frame_times[:frames], result
+
+
+def measure(names, canvas_mode=CANVAS_MODE):
+    """Runs every named scenario twice, once timed and once under tracemalloc, and returns the results."""
+    game = LeapOfFaith.Game(canvas_mode=canvas_mode)
+    game.wait_until_loaded()
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        game.simulation = None
+        frame_times, result = run_scenario(game, scenario)
+        ordered = sorted(frame_times)
+        result.update({
+            'fps': len(frame_times) / sum(frame_times),
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p90_ms': ordered[int(len(ordered) * 0.9)] * 1000,
+            'p99_ms': ordered[int(len(ordered) * 0.99)] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        })
+        # Allocations are traced in a second pass, as tracing slows every frame down
+        game.simulation = None
+        _, memory = run_scenario(game, scenario, trace_memory=True)
+        result.update({key: memory[key] for key in ('net_alloc_kib', 'peak_alloc_kib')})
+        results[name] = result
+        print(f'{name:>10}: {result["fps"]:8.0f} fps  p50 {result["p50_ms"]:.2f} ms  '
+              f'p99 {result["p99_ms"]:.2f} ms  peak alloc {result["peak_alloc_kib"]:.0f} KiB  '
+              f'{result["frames"]} frames, {result["runs"]} runs, lowest level {result["lowest_level"]}, '
+              f'{len(result["tile_types"])} tile types')
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Returns a message for every scenario that got slower than the baseline by more than the threshold."""
+    messages = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['fps'] < expected['fps'] * (1 - threshold):
+            messages.append(f'{name}: {result["fps"]:.0f} fps, baseline {expected["fps"]:.0f} fps')
+        if result['p99_ms'] > expected['p99_ms'] * (1 + threshold) + NOISE_MS:
+            messages.append(f'{name}: p99 {result["p99_ms"]:.2f} ms, baseline {expected["p99_ms"]:.2f} ms')
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Headless benchmark scenarios with a regression gate.')
+    parser.add_argument('scenarios', nargs='*',
+                        help=f'scenarios to run out of {", ".join(SCENARIOS)}, all by default')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help=f'baseline JSON file, {BASELINE} by default')
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative drop in fps or rise in p99 frame time, 0.25 by default')
+    parser.add_argument('--canvas', choices=tuple(CANVAS_SCALES), default=CANVAS_MODE,
+                        help=f'canvas mode to draw in, {CANVAS_MODE} by default')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name}')
+
+    results = measure(args.scenarios or list(SCENARIOS), args.canvas)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f'Baseline written to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures = regressions(results, json.load(f), args.threshold)
+        for message in failures:
+            print(f'Regression: {message}')
+        if failures:
+            sys.exit(1)
+        print(f'No scenario regressed by more than {args.threshold:.0%}')
+    else:
+        print(f'No baseline at {args.baseline}, run with --save to record one')
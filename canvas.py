@@ -0,0 +1,87 @@
+import pygame as pg
+from settings import *
+from assets import convert, scaled_size
+
+"""
+The canvas module for the "Leap of Faith: The 100-Floor Trials" game. This module holds the surface the scene is
+drawn on. In the full mode that is the window itself, as before. In the native mode it is an off-screen canvas at the
+art's own resolution, 1/CANVAS_SCALES['native'] of the window, holding sprites loaded at that size, and it is upscaled
+onto the window with one integer nearest-neighbour scale per frame, so every blit moves a fraction of the pixels.
+With dirty display updates only the changed regions are scaled up.
+
+Drawing code keeps working in window coordinates either way: positions are divided down onto the canvas and the
+drawn regions come back in window coordinates, so dirty rect tracking and the simulation never see the canvas size.
+"""
+
+
+class Canvas:
+    """A class representing the surface the game scene is drawn on.
+    scale is the integer factor between the window and the canvas, 1 draws straight onto the window.
+    Images passed in must be loaded at the canvas size, e.g. with the asset registry's scale argument."""
+
+    def __init__(self, window, scale=1):
+        self.window = window
+        self.scale = scale
+        self.surface = window if scale == 1 else convert(
+            pg.Surface(scaled_size(window.get_size(), scale)), alpha=False)
+
+    def to_window(self, rect):
+        """Returns a region of the canvas in window coordinates."""
+        scale = self.scale
+        if scale == 1:
+            return rect
+        return pg.Rect(rect.x * scale, rect.y * scale, rect.w * scale, rect.h * scale)
+
+    def to_canvas(self, rect):
+        """Returns the canvas pixels covering a region given in window coordinates."""
+        scale = self.scale
+        left, top = rect.left // scale, rect.top // scale
+        return pg.Rect(left, top, -(-rect.right // scale) - left, -(-rect.bottom // scale) - top)
+
+    def rect(self, image, **position):
+        """Returns the window region an image covers once upscaled, placed like Surface.get_rect()."""
+        rect = pg.Rect((0, 0), (image.get_width() * self.scale, image.get_height() * self.scale))
+        for name, value in position.items():
+            setattr(rect, name, value)
+        return rect
+
+    def blit(self, image, position, area=None):
+        """Draws an image at a position in window coordinates and returns the covered window region."""
+        if self.scale == 1:
+            return self.surface.blit(image, position, area)
+        scale = self.scale
+        if area is not None:
+            area = self.to_canvas(area)
+        return self.to_window(self.surface.blit(image, (position[0] // scale, position[1] // scale), area))
+
+    def draw(self, sprites):
+        """Draws a sprite group at the sprites' window rects."""
+        if self.scale == 1:
+            sprites.draw(self.surface)
+        else:
+            scale = self.scale
+            self.surface.blits([(sprite.image, (sprite.rect.x // scale, sprite.rect.y // scale))
+                                for sprite in sprites], doreturn=False)
+
+    def draw_rect(self, color, rect, width=0):
+        """Draws a rectangle given in window coordinates, its border thinned down with the canvas."""
+        if self.scale == 1:
+            return pg.draw.rect(self.surface, color, rect, width)
+        return self.to_window(pg.draw.rect(self.surface, color, self.to_canvas(rect),
+                                           width and max(width // self.scale, 1)))
+
+    def fill(self, color):
+        self.surface.fill(color)
+
+    def present(self, rects=None):
+        """Upscales the canvas onto the window, only the given window regions if any,
+        a no-op when drawing straight onto the window."""
+        if self.scale == 1:
+            return
+        if rects is None:
+            pg.transform.scale(self.surface, self.window.get_size(), self.window)
+            return
+        for rect in rects:
+            # The regions come snapped to whole canvas pixels, so each one scales up exactly
+            pg.transform.scale(self.surface.subsurface(self.to_canvas(rect)), rect.size,
+                               self.window.subsurface(rect))
@@ -0,0 +1,128 @@
+import time
+import pygame as pg
+from settings import *
+
+"""
+The display module for the "Leap of Faith: The 100-Floor Trials" game. This module decides which parts of the
+screen are pushed to the display each frame. In the dirty mode only the regions that changed since the last frame
+are updated: moving sprites, the scrolling walls, the saw row, and HUD elements whose value changed. In the full mode
+the whole window is flipped every frame as before, so both paths can be measured against each other.
+"""
+
+SCREEN_RECT = pg.Rect(0, 0, WIDTH, HEIGHT)
+
+
+def snap_rect(rect, grid):
+    """Grows a rect outwards to whole cells of the given grid."""
+    left, top = rect.left // grid * grid, rect.top // grid * grid
+    return pg.Rect(left, top, -(-rect.right // grid) * grid - left, -(-rect.bottom // grid) * grid - top)
+
+
+def merge_rects(rects, grid=1):
+    """Clips the rects to the screen and merges overlapping ones whose union covers no more pixels
+    than the two rects together, e.g. a sprite's old and new position.
+    With a grid, the rects are first grown to the pixels of an upscaled canvas."""
+    merged = []
+    for rect in rects:
+        if grid != 1:
+            rect = snap_rect(rect, grid)
+        rect = rect.clip(SCREEN_RECT)
+        if not rect:
+            continue
+        i = 0
+        while i < len(merged):
+            other = merged[i]
+            union = rect.union(other)
+            if rect.colliderect(other) and union.w * union.h <= rect.w * rect.h + other.w * other.h:
+                rect = union
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    return merged
+
+
+class DisplayUpdater:
+    """A class representing the display updates of the game.
+    Drawing code reports what it changed with add(), track_sprites() and changed(),
+    and update() then pushes only those regions, or the whole window in the full mode
+    or after the screen was switched. Frames, rects, pixels and update time are counted
+    to compare both modes. grid is the scale of the canvas the screen is upscaled from,
+    as a sprite on it covers whole canvas pixels rather than exactly its rect."""
+
+    def __init__(self, mode=DISPLAY_MODE, grid=1):
+        self.mode = mode
+        self.grid = grid
+        self.rects = []
+        self.full_update = True
+        self.sprite_rects = {}
+        self.values = {}
+        self.frames = 0
+        self.updates = 0
+        self.pixels = 0
+        self.update_time = 0
+
+    def add(self, *rects):
+        """Marks regions of the screen as changed in this frame."""
+        self.rects.extend(rects)
+
+    def invalidate(self):
+        """Marks the whole screen as changed in this frame."""
+        self.full_update = True
+
+    def track_sprites(self, name, sprites):
+        """Marks where the sprites were drawn in the last frame and where they are drawn now."""
+        rects = [sprite.rect.copy() for sprite in sprites]
+        self.rects.extend(self.sprite_rects.get(name, ()))
+        self.rects.extend(rects)
+        self.sprite_rects[name] = rects
+
+    def changed(self, name, value, *rects):
+        """Marks the given regions, and those of the previous value, when a value shown on screen changes.
+        Without rects the whole screen is marked, e.g. when switching between screens."""
+        previous = self.values.get(name)
+        if previous is not None and previous[0] == value:
+            return
+        if rects:
+            self.rects.extend(rects)
+            if previous is not None:
+                self.rects.extend(previous[1])
+        else:
+            self.full_update = True
+        self.values[name] = (value, rects)
+
+    def pending(self):
+        """Returns the merged regions marked so far, or None when the whole window is to be updated."""
+        if self.mode == 'full' or self.full_update:
+            return None
+        return merge_rects(self.rects, self.grid)
+
+    def update(self):
+        """Pushes the changed regions, or the whole window, to the display."""
+        start = time.perf_counter()
+        if self.mode == 'full' or self.full_update:
+            pg.display.update()
+            self.updates += 1
+            self.pixels += WIDTH * HEIGHT
+        else:
+            rects = merge_rects(self.rects, self.grid)
+            pg.display.update(rects)
+            self.updates += len(rects)
+            self.pixels += sum(rect.w * rect.h for rect in rects)
+        self.update_time += time.perf_counter() - start
+        self.frames += 1
+        self.rects = []
+        self.full_update = False
+
+    def stats(self):
+        """Returns the average rects, pixels and update time per frame."""
+        frames = max(self.frames, 1)
+        return {
+            'mode': self.mode,
+            'frames': self.frames,
+            'rects_per_frame': self.updates / frames,
+            'pixels_per_frame': self.pixels / frames,
+            'screen_fraction': self.pixels / frames / (WIDTH * HEIGHT),
+            'update_ms': self.update_time / frames * 1000,
+        }
@@ -0,0 +1,115 @@
+import os
+import time
+from array import array
+from settings import *
+
+"""
+The governor module for the "Leap of Faith: The 100-Floor Trials" game. This module adapts the drawing quality to how
+long the host actually takes to draw a frame. The game always steps at FPS steps per second and drops rendered frames
+when the host falls behind, so a loaded host shows up as frames that take longer than their budget. The governor then
+steps down through the QUALITY_LEVELS, freezing the saw and conveyor animation, drawing a flat backdrop with still
+walls and recomputing the HUD every other frame, and steps back up once the frames leave enough headroom.
+
+Every change is printed with the wall-clock time and the host's load average, so it can be matched with host load.
+Run "python LeapOfFaith.py --quality flat" to pin a level instead, e.g. to measure it with the profiler.
+"""
+
+FULL, FROZEN, FLAT, SPARSE_HUD = (QUALITY_LEVELS.index(name) for name in ('full', 'frozen', 'flat', 'sparse_hud'))
+
+
+def load_average():
+    """Returns the host's one-minute load average, or None where the platform has none."""
+    if hasattr(os, 'getloadavg'):
+        try:
+            return os.getloadavg()[0]
+        except OSError:
+            return None
+    return None
+
+
+class QualityGovernor:
+    """A class representing the adaptive quality governor.
+    add() takes the milliseconds the last frame took to run, without the time the clock waited to cap the
+    frame rate, into a moving window kept in a preallocated ring with a running total. Once the window is
+    full, a mean above the budget steps one level down. A step up needs the mean under the headroom fraction
+    of the budget for patience frames, which starts at one window and doubles, up to GOVERNOR_MAX_PATIENCE,
+    whenever a step up is undone by the very next window, so a host on the edge doesn't flicker between levels.
+    The window starts over after every change, so a level is only judged by frames drawn at it.
+    In a fixed mode the level never changes."""
+
+    def __init__(self, budget, mode=QUALITY_MODE, window=GOVERNOR_WINDOW, headroom=GOVERNOR_HEADROOM):
+        self.budget = budget
+        self.adaptive = mode == 'auto'
+        self.level = FULL if self.adaptive else QUALITY_LEVELS.index(mode)
+        self.window = window
+        self.headroom = headroom
+        self.times = array('d', bytes(8 * window))
+        self.total = 0
+        self.count = 0
+        self.patience = window
+        self.stepped_up = False
+        self.frames = 0
+        self.level_frames = [0] * len(QUALITY_LEVELS)
+        self.changes = []
+
+    def add(self, frame_time):
+        """Adds the milliseconds the last frame took and returns whether the quality level changed."""
+        self.frames += 1
+        self.level_frames[self.level] += 1
+        if not self.adaptive:
+            return False
+        i = self.count % self.window
+        if self.count >= self.window:
+            self.total -= self.times[i]
+        self.times[i] = frame_time
+        self.total += frame_time
+        self.count += 1
+        if self.count < self.window:
+            return False
+
+        mean = self.total / self.window
+        if mean > self.budget and self.level < len(QUALITY_LEVELS) - 1:
+            # A step up undone by the first window after it waits longer before the next try
+            if self.stepped_up and self.count == self.window:
+                self.patience = min(self.patience * 2, GOVERNOR_MAX_PATIENCE)
+            self.change(self.level + 1, mean)
+            return True
+        if mean < self.budget * self.headroom and self.level > FULL and self.count >= self.patience:
+            self.change(self.level - 1, mean)
+            self.stepped_up = True
+            return True
+        if self.count == self.window:
+            self.stepped_up = False
+        return False
+
+    def change(self, level, mean):
+        """Switches to a quality level, prints the change and starts a new window."""
+        load = load_average()
+        self.changes.append({
+            'time': time.time(),
+            'frame': self.frames,
+            'from': QUALITY_LEVELS[self.level],
+            'to': QUALITY_LEVELS[level],
+            'mean_ms': mean,
+            'load': load,
+        })
+        print(f'{time.strftime("%H:%M:%S")} quality {QUALITY_LEVELS[self.level]} -> {QUALITY_LEVELS[level]} '
+              f'at frame {self.frames}: mean frame {mean:.2f} ms of a {self.budget:.2f} ms budget, '
+              f'load average {"n/a" if load is None else f"{load:.2f}"}')
+        self.level = level
+        self.stepped_up = False
+        self.total = 0
+        self.count = 0
+
+    def refresh_hud(self):
+        """Returns whether the HUD is to be recomputed in this frame."""
+        return self.level < SPARSE_HUD or self.frames % 2 == 0
+
+    def stats(self):
+        """Returns the current level, the frames drawn at every level and the changes made."""
+        return {
+            'level': QUALITY_LEVELS[self.level],
+            'frames': dict(zip(QUALITY_LEVELS, self.level_frames)),
+            'changes': len(self.changes),
+            'patience_frames': self.patience,
+        }
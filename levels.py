@@ -0,0 +1,219 @@
+import argparse
+import time
+from collections import deque
+from itertools import accumulate
+from random import Random
+from settings import *
+
+"""
+The levels module for the "Leap of Faith: The 100-Floor Trials" game. This module generates the terrain spawns of a
+run ahead of time from its seed. Spawns are drawn in chunks and kept in a bounded lookahead buffer ahead of the
+camera, so spawning a tile only pops the next one. Every chunk goes through a cheap reachability pass before it is
+accepted: knowing the hero's moving speed, the fall speed and the spacing between spawns, it follows the tiles the
+hero can land on and the health left on each, and a chunk that no path of landable tiles leads through is drawn again.
+
+Run "python levels.py" to pre-generate and validate a batch of 100-floor layouts and compare them with unchecked ones.
+"""
+
+TERRAIN_TYPES = list(TERRAIN.keys())
+HERO_SIZE = HERO_WIDTH * 2
+# The Hero Closes in on a Tile Below at the Fall Speed Plus the Terrain Speed
+CLOSING_SPEED = FALL_SPEED + TERRAIN_SPEED
+# Steps a Falling Hero Takes to Get Below the Tile It Dropped Off
+CLEAR_STEPS = -(-(TERRAIN_HEIGHT + HERO_SIZE) // CLOSING_SPEED)
+
+
+def level_spawns(spawnTicks=TERRAIN_SPAWN_TICKS):
+    """Returns the spawns passed in a 100-floor run. The level counts only the hero's fall on screen,
+    which is 3/4 of its descent past the tiles."""
+    return -(-TOP_LEVEL * HEIGHT * CLOSING_SPEED // (FALL_SPEED * spawnTicks * TERRAIN_SPEED)) + \
+        HEIGHT // (spawnTicks * TERRAIN_SPEED)
+
+
+LEVEL_SPAWNS = level_spawns()
+
+
+def drop_origins(x):
+    """Returns the side and hero center at which a hero can drop off the tile centered at x,
+    if there is room for the hero between the tile and the wall."""
+    left = x - TERRAIN_WIDTH // 2
+    right = left + TERRAIN_WIDTH
+    origins = []
+    if left - WALL_WIDTH >= HERO_SIZE:
+        origins.append((-1, left - HERO_SIZE // 2))
+    if WIDTH - WALL_WIDTH - right >= HERO_SIZE:
+        origins.append((1, right + HERO_SIZE // 2))
+    return origins
+
+
+# Drop Origins of Every Tile Position a Spawn Can Take
+DROP_ORIGINS = {x: drop_origins(x) for x in range(TERRAIN_SPAWNLEFT, TERRAIN_SPAWNRIGHT + 1)}
+
+
+def reachable(source_x, target_x, gap):
+    """Checks whether a hero standing on the tile centered at source_x can land on the tile centered at target_x,
+    whose top is gap pixels lower. Moving back under the source tile only starts once the hero fell below it."""
+    steps = gap // CLOSING_SPEED
+    lo = target_x - TERRAIN_WIDTH // 2 + HERO_WIDTH // 2
+    hi = target_x + TERRAIN_WIDTH // 2 - HERO_WIDTH // 2
+    origins = DROP_ORIGINS.get(source_x)
+    for side, x in drop_origins(source_x) if origins is None else origins:
+        if x < lo:
+            distance, under = lo - x, side < 0
+        elif x > hi:
+            distance, under = x - hi, side > 0
+        else:
+            return True
+        if distance <= (steps - CLEAR_STEPS * under) * MOVING_SPEED:
+            return True
+    return False
+
+
+def landable_tiles(frontier, spawns, spacing, maxHealth=MAX_HEALTH):
+    """Follows the hero through a run of spawns from the tiles it may stand on before them.
+    frontier holds (index, x, health) of those tiles, indexed from -1 backwards, and the landable spawns are
+    returned the same way, with the best health the hero can have left when landing on each."""
+    tiles = deque(frontier)
+    for i, (terrain_type, x) in enumerate(spawns):
+        while tiles and i - tiles[0][0] > LEVEL_MAX_SKIP:
+            tiles.popleft()
+        health = max((tile_health for index, tile_x, tile_health in tiles
+                      if reachable(tile_x, x, (i - index) * spacing)), default=0)
+        if terrain_type == 'spike_tile':
+            health -= 1
+        elif terrain_type == 'heal_tile' and health:
+            health = min(health + 1, maxHealth)
+        if health > 0:
+            tiles.append((i, x, health))
+    return [(index - len(spawns), x, health) for index, x, health in tiles
+            if index >= len(spawns) - LEVEL_MAX_SKIP]
+
+
+class LevelGenerator:
+    """A class representing the seeded, ahead-of-time generator of the terrain spawns.
+    Spawns are (terrain type, x) pairs drawn in chunks of chunkSize and kept in a buffer that is refilled
+    whenever fewer than lookahead spawns are left, so it never holds more than lookahead + chunkSize.
+    A chunk is drawn again until the reachability pass finds a way through it; after LEVEL_MAX_ATTEMPTS
+    draws the last one is kept and counted as unchecked. Spawns are drawn like the game always did,
+    a weighted type and then an x position per tile, so an accepted first draw keeps the old layout."""
+
+    def __init__(self, seed=None, spawnTicks=TERRAIN_SPAWN_TICKS, chunkSize=LEVEL_CHUNK_SIZE,
+                 lookahead=LEVEL_LOOKAHEAD, maxAttempts=LEVEL_MAX_ATTEMPTS,
+                 weights=TERRAIN_SPAWN_WEIGHTS, maxHealth=MAX_HEALTH):
+        self.rng = Random()
+        self.cum_weights = list(accumulate(weights))
+        self.max_health = maxHealth
+        self.chunk_size = chunkSize
+        self.lookahead = lookahead
+        self.max_attempts = maxAttempts
+        self.buffer = deque()
+        # The RNG state last saved or restored, reused by snapshots until the next chunk is drawn
+        self.rng_state = None
+        self.reset(seed, spawnTicks)
+
+    def reset(self, seed=None, spawnTicks=TERRAIN_SPAWN_TICKS):
+        """Starts the spawns of a new run from the given seed."""
+        self.seed = seed
+        self.rng.seed(seed)
+        self.rng_state = None
+        self.spacing = spawnTicks * TERRAIN_SPEED
+        self.buffer.clear()
+        # Every run starts on a common tile in the middle, one spawn above the first generated one
+        self.frontier = [(-1, WIDTH // 2, self.max_health)]
+        self.chunks = 0
+        self.redrawn = 0
+        self.unchecked = 0
+
+    def draw_chunk(self):
+        rng = self.rng
+        self.rng_state = None
+        return [(rng.choices(TERRAIN_TYPES, cum_weights=self.cum_weights)[0],
+                 rng.randint(TERRAIN_SPAWNLEFT, TERRAIN_SPAWNRIGHT)) for _ in range(self.chunk_size)]
+
+    def generate_chunk(self):
+        """Appends the next chunk that passes the reachability pass to the buffer."""
+        for attempt in range(self.max_attempts):
+            chunk = self.draw_chunk()
+            frontier = landable_tiles(self.frontier, chunk, self.spacing, self.max_health)
+            if frontier:
+                self.redrawn += attempt
+                break
+        else:
+            self.redrawn += attempt
+            self.unchecked += 1
+            # Nothing in the kept chunk is known to be landable, so its last tiles are assumed to be
+            frontier = [(i - len(chunk), x, 1) for i, (_, x) in enumerate(chunk)
+                        if i >= len(chunk) - LEVEL_MAX_SKIP]
+        self.frontier = frontier
+        self.chunks += 1
+        self.buffer.extend(chunk)
+
+    def next_spawn(self):
+        """Returns the type and x position of the next terrain to spawn."""
+        while len(self.buffer) <= self.lookahead:
+            self.generate_chunk()
+        return self.buffer.popleft()
+
+    def generate_until(self, spawns):
+        """Generates chunks until the first spawns of the run are all drawn, e.g. to count the redraws
+        of a whole layout after its run ended early."""
+        while self.chunks * self.chunk_size < spawns:
+            self.generate_chunk()
+
+    def snapshot(self):
+        """Returns the RNG state, the buffered spawns, the frontier and the chunk counters."""
+        # Copying the RNG state is the costly part, so it is only copied again once a chunk was drawn
+        if self.rng_state is None:
+            self.rng_state = self.rng.getstate()
+        return (self.rng_state, tuple(self.buffer), self.frontier,
+                self.chunks, self.redrawn, self.unchecked)
+
+    def restore(self, snapshot):
+        """Brings the generator back to the state of a snapshot."""
+        rng_state, buffer, self.frontier, self.chunks, self.redrawn, self.unchecked = snapshot
+        if rng_state is not self.rng_state:
+            self.rng.setstate(rng_state)
+            self.rng_state = rng_state
+        self.buffer.clear()
+        self.buffer.extend(buffer)
+
+    def stats(self):
+        """Returns the chunk counters of the current run."""
+        return {
+            'chunks': self.chunks,
+            'redrawn': self.redrawn,
+            'unchecked': self.unchecked,
+            'buffered': len(self.buffer),
+        }
+
+
+def generate_layout(seed, spawns=None, spawnTicks=TERRAIN_SPAWN_TICKS, maxAttempts=LEVEL_MAX_ATTEMPTS,
+                    weights=TERRAIN_SPAWN_WEIGHTS, maxHealth=MAX_HEALTH):
+    """Returns the first spawns of the run of a seed, enough for 100 floors by default, and the generator."""
+    generator = LevelGenerator(seed, spawnTicks, maxAttempts=maxAttempts, weights=weights, maxHealth=maxHealth)
+    if spawns is None:
+        spawns = level_spawns(spawnTicks)
+    return [generator.next_spawn() for _ in range(spawns)], generator
+
+
+def validate_layout(layout, spawnTicks=TERRAIN_SPAWN_TICKS, maxHealth=MAX_HEALTH):
+    """Checks in one pass over a whole layout that a path of landable tiles leads from the start to its end."""
+    return bool(landable_tiles([(-1, WIDTH // 2, maxHealth)], layout, spawnTicks * TERRAIN_SPEED, maxHealth))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pre-generate and validate 100-floor terrain layouts in batch.')
+    parser.add_argument('--layouts', type=int, default=1000,
+                        help='number of layouts, from seed 0 upwards, 1000 by default')
+    args = parser.parse_args()
+
+    for name, attempts in (('unchecked', 1), ('checked', LEVEL_MAX_ATTEMPTS)):
+        start = time.perf_counter()
+        layouts = [generate_layout(seed, maxAttempts=attempts) for seed in range(args.layouts)]
+        elapsed = time.perf_counter() - start
+        valid = sum(validate_layout(layout) for layout, _ in layouts)
+        redrawn = sum(generator.redrawn for _, generator in layouts)
+        chunks = sum(generator.chunks for _, generator in layouts)
+        print(f'{name:>9}: {args.layouts / elapsed:6.0f} layouts of {LEVEL_SPAWNS} spawns per second, '
+              f'{valid}/{args.layouts} survivable, {redrawn} of {chunks + redrawn} chunks redrawn')
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+
+"""
+The loader module for the "Leap of Faith: The 100-Floor Trials" game. This module decodes images and sounds on a
+pool of worker threads, so the game window can show a loading screen from its very first frame instead of staying
+blank until every asset is ready. Tasks are named, so a task that was already started, e.g. prefetching a hero's
+sheets, is never submitted twice and its result can be waited for when it is actually needed.
+"""
+
+
+class AssetLoader:
+    """A class representing the background asset loader.
+    Every task runs on the worker thread pool and is kept under its name. An exception raised by a task
+    is re-raised on the main thread when its result is requested."""
+
+    def __init__(self, workers=LOADER_WORKERS):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='asset-loader')
+        self.tasks = {}
+
+    def submit(self, name, function, *args):
+        """Starts a named task unless it was already started, and returns its future."""
+        future = self.tasks.get(name)
+        if future is None:
+            future = self.tasks[name] = self.executor.submit(function, *args)
+        return future
+
+    def progress(self, names):
+        """Returns the fraction of the named tasks that have finished."""
+        return sum(self.tasks[name].done() for name in names) / max(len(names), 1)
+
+    def result(self, name):
+        """Waits for a named task and returns its result."""
+        return self.tasks[name].result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
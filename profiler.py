@@ -0,0 +1,145 @@
+import csv
+import json
+import time
+from array import array
+from settings import *
+from assets import registry
+
+"""
+The profiler module for the "Leap of Faith: The 100-Floor Trials" game. This module timestamps every phase of a
+frame, such as event handling, background drawing, the simulation step, collision, the HUD and the display update,
+into a preallocated ring buffer of the most recent frames. A small overlay shows the p50 and p99 frame times, and the
+buffer can be exported to CSV or JSON. When profiling is off the game uses the NullProfiler, whose calls do nothing.
+
+Run "python LeapOfFaith.py --profile" to profile a session; press F12 to export the trace, it is also written on exit.
+"""
+
+PHASES = ('events', 'background', 'terrains_draw', 'hero_draw', 'simulation', 'collision',
+          'terrains_update', 'hero_update', 'hud', 'pregame', 'present', 'profiler', 'display')
+
+
+def percentile(values, fraction):
+    """Returns the value below which the given fraction of the sorted values lies."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class FrameProfiler:
+    """A class representing the per-phase frame profiler.
+    Each frame takes one row of a ring buffer allocated up front, holding the seconds spent in every phase
+    and the total frame time, so profiling never allocates while the game runs.
+    mark(phase) charges the time since the previous mark to a phase, and phases marked several times
+    in one frame, like collision at a higher playback speed, add up."""
+
+    def __init__(self, path='profile.json', capacity=PROFILER_FRAMES):
+        self.path = path
+        self.capacity = capacity
+        self.index = {phase: i for i, phase in enumerate(PHASES)}
+        self.width = len(PHASES) + 1
+        self.samples = array('d', bytes(8 * capacity * self.width))
+        self.frames = 0
+        self.row = 0
+        self.last = 0
+        self.start = 0
+        self.overlay = None
+
+    def begin_frame(self):
+        """Starts a new row of the ring buffer, overwriting the oldest frame once it is full."""
+        self.row = (self.frames % self.capacity) * self.width
+        for i in range(self.row, self.row + self.width):
+            self.samples[i] = 0
+        self.start = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Charges the time since the previous mark to the given phase."""
+        now = time.perf_counter()
+        self.samples[self.row + self.index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        self.samples[self.row + self.width - 1] = time.perf_counter() - self.start
+        self.frames += 1
+
+    def instrument(self, obj, method, phase, outer_phase):
+        """Wraps a method of an object, so its time is charged to its own phase instead of the calling one."""
+        wrapped = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            self.mark(outer_phase)
+            result = wrapped(*args, **kwargs)
+            self.mark(phase)
+            return result
+        setattr(obj, method, timed)
+
+    def rows(self):
+        """Yields the recorded frames from the oldest to the newest as (frame, total, phase times)."""
+        # One row is left out, as it belongs to the frame in progress
+        count = min(self.frames, self.capacity - 1)
+        for frame in range(self.frames - count, self.frames):
+            row = (frame % self.capacity) * self.width
+            yield frame, self.samples[row + self.width - 1], self.samples[row:row + self.width - 1]
+
+    def summary(self):
+        """Returns the p50 and p99 of the frame time and of every phase in milliseconds."""
+        rows = list(self.rows())
+        if not rows:
+            return {}
+        columns = {'frame': sorted(total for _, total, _ in rows)}
+        for phase, i in self.index.items():
+            columns[phase] = sorted(times[i] for _, _, times in rows)
+        return {name: {'p50': percentile(values, 0.5) * 1000, 'p99': percentile(values, 0.99) * 1000}
+                for name, values in columns.items()}
+
+    def draw_overlay(self, screen, display):
+        """Draws the p50 and p99 frame times in the bottom left corner, refreshed twice a second."""
+        # The text is rendered directly, as it changes too often to be worth a text cache entry
+        if self.overlay is None or self.frames % (FPS // 2) == 0:
+            frame = self.summary().get('frame', {'p50': 0, 'p99': 0})
+            self.overlay = registry.font(*PROFILER_FONT).render(
+                f'frame p50 {frame["p50"]:.1f} ms  p99 {frame["p99"]:.1f} ms', True, 'white')
+        display.add(screen.blit(self.overlay, self.overlay.get_rect(
+            bottomleft=(WALL_WIDTH + 5, HEIGHT - 5))))
+
+    def export(self, path=None):
+        """Writes the recorded frames to a CSV or JSON file, chosen by the file extension."""
+        path = path or self.path
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(('frame', 'total_ms') +
+                                tuple(f'{phase}_ms' for phase in PHASES))
+                for frame, total, times in self.rows():
+                    writer.writerow([frame, round(total * 1000, 4)] +
+                                    [round(t * 1000, 4) for t in times])
+        else:
+            with open(path, 'w') as f:
+                json.dump({
+                    'phases': PHASES,
+                    'summary': self.summary(),
+                    'frames': [{'frame': frame, 'total_ms': total * 1000,
+                                'phases_ms': dict(zip(PHASES, (t * 1000 for t in times)))}
+                               for frame, total, times in self.rows()],
+                }, f, indent=1)
+        print(f'Profile of the last {min(self.frames, self.capacity - 1)} frames written to {path}')
+
+
+class NullProfiler:
+    """A class representing a disabled profiler.
+    Every call returns immediately, so a game without --profile pays only for the empty calls."""
+
+    def begin_frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def instrument(self, obj, method, phase, outer_phase):
+        pass
+
+    def draw_overlay(self, screen, display):
+        pass
+
+    def export(self, path=None):
+        pass
@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import struct
+import sys
+import time
+from collections import deque
+from random import Random
+import pygame as pg
+from settings import *
+from assets import registry
+from atlas import load_hero_assets, load_startup_assets
+from animation import clip
+from replay import HERO_TYPES, parse_seed
+from simulation import Simulation, heuristic_action
+from sweep import random_player
+from LeapOfFaith import Hero, render_font
+
+"""
+The race module for the "Leap of Faith: The 100-Floor Trials" game. This module runs a two-player race down the same
+seeded tower, with each player's side talking to the other over a UDP socket on the loopback interface. The local
+hero always steps with the local input right away. The opponent's inputs arrive one simulated latency later, so until
+they do the opponent is assumed to keep its last action; when an input turns out to differ, the opponent's simulation
+is restored from the snapshot taken before that step and stepped again with the real inputs. Each player's screen
+therefore responds immediately, and the opponent's hero, drawn as a ghost, snaps to where it really is.
+
+Run "python race.py --latency 100" to race the heuristic player with the arrow keys, or "python race.py --check"
+to race two scripted players headlessly over a lossy link and check both sides agree with an offline replay.
+"""
+
+PLAYERS = ('keys', 'heuristic', 'random')
+# Input Packet Binary Layout
+INPUTS = struct.Struct('<BIIB')  # Player, Opponent Inputs Received, First Step, Count, Followed by the Actions
+GHOST_ALPHA = 110
+
+
+class RaceSession:
+    """A class representing one player's side of a two-player race.
+    Both heroes race in their own simulation from the same seed. The local one steps with the local inputs,
+    the opponent's one with its confirmed inputs and past them with a prediction that the opponent repeats
+    its last action. Before each predicted step the opponent's state is snapshotted, and once the real input
+    of a predicted step arrives and differs, the simulation is restored to that step and stepped again.
+    The prediction never runs more than maxRollback steps ahead of the confirmed inputs; the session stalls
+    instead. Rollbacks, re-simulated steps and stalls are counted to see what a latency costs."""
+
+    def __init__(self, player, heroTypes, seed, maxRollback=RACE_ROLLBACK):
+        self.player = player
+        self.local = Simulation(heroTypes[player], seed)
+        self.remote = Simulation(heroTypes[1 - player], seed)
+        self.max_rollback = maxRollback
+        self.tick = 0
+        self.local_inputs = []
+        self.remote_inputs = []
+        self.acked = 0
+        # (Snapshot Before the Step, Predicted Action) of Every Step Past the Confirmed Inputs
+        self.predicted = deque()
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.max_depth = 0
+        self.stalls = 0
+
+    def advance(self, action):
+        """Steps both simulations once, unless the prediction got too far ahead. Returns whether it stepped."""
+        if self.tick - len(self.remote_inputs) >= self.max_rollback:
+            self.stalls += 1
+            return False
+        self.local_inputs.append(action)
+        self.local.step(action)
+        self.step_remote(self.tick)
+        self.tick += 1
+        return True
+
+    def step_remote(self, step):
+        """Steps the opponent's simulation with the input of the given step, or the predicted one."""
+        remote_inputs = self.remote_inputs
+        if step < len(remote_inputs):
+            action = remote_inputs[step]
+        else:
+            action = remote_inputs[-1] if remote_inputs else ACTION_IDLE
+            self.predicted.append((self.remote.snapshot(), action))
+        self.remote.step(action)
+
+    def receive(self, first, actions, acked):
+        """Takes the opponent's inputs from the given step on and rolls back if a prediction was wrong."""
+        self.acked = max(self.acked, acked)
+        confirmed = len(self.remote_inputs)
+        # Inputs are resent until acknowledged, so anything after a gap arrives again later
+        if first > confirmed:
+            return
+        actions = actions[confirmed - first:]
+        rollback = None
+        for i, action in enumerate(actions):
+            if rollback is None and self.predicted:
+                snapshot, predicted = self.predicted.popleft()
+                if action != predicted:
+                    rollback = (confirmed + i, snapshot)
+        self.remote_inputs.extend(actions)
+
+        if rollback is not None:
+            first_wrong, snapshot = rollback
+            self.predicted.clear()
+            self.remote.restore(snapshot)
+            for step in range(first_wrong, self.tick):
+                self.step_remote(step)
+            self.rollbacks += 1
+            self.resimulated += self.tick - first_wrong
+            self.max_depth = max(self.max_depth, self.tick - first_wrong)
+
+    def packet(self):
+        """Returns a packet of the local inputs the opponent has not acknowledged yet."""
+        actions = self.local_inputs[self.acked:self.acked + RACE_RESEND]
+        return INPUTS.pack(self.player, len(self.remote_inputs), self.acked, len(actions)) + bytes(actions)
+
+    def finished(self):
+        """Checks whether both runs ended and the opponent's end is confirmed."""
+        return self.local.done and self.remote.done and len(self.remote_inputs) >= self.remote.tick
+
+    def winner(self):
+        """Returns the player who won the race, the first to win or else the one who got deeper and then
+        lasted longer, or None for a draw. Only final once the race is finished."""
+        runs = {self.player: self.local, 1 - self.player: self.remote}
+        ranks = {player: (simulation.cause == 'win', -simulation.tick if simulation.cause == 'win' else
+                          -simulation.level, simulation.tick) for player, simulation in runs.items()}
+        if ranks[0] == ranks[1]:
+            return None
+        return max(ranks, key=ranks.get)
+
+    def stats(self):
+        """Returns the rollback counters of the session."""
+        return {
+            'steps': self.tick,
+            'rollbacks': self.rollbacks,
+            'resimulated': self.resimulated,
+            'max_depth': self.max_depth,
+            'stalls': self.stalls,
+            'unconfirmed': self.tick - len(self.remote_inputs),
+        }
+
+
+class RaceProtocol(asyncio.DatagramProtocol):
+    """A class representing the UDP endpoint of a race session.
+    Sent packets are held back by the simulated latency and dropped at the given loss rate,
+    and received packets are handed to the session as they arrive, between two steps."""
+
+    def __init__(self, session, latency=RACE_LATENCY, loss=0, seed=None):
+        self.session = session
+        self.latency = latency / 1000
+        self.loss = loss
+        self.rng = Random(seed)
+        self.transport = None
+        self.peer = None
+        self.sent = 0
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        player, acked, first, count = INPUTS.unpack_from(data)
+        self.session.receive(first, data[INPUTS.size:INPUTS.size + count], acked)
+
+    def send(self):
+        """Sends the session's pending inputs to the opponent."""
+        self.sent += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        asyncio.get_running_loop().call_later(self.latency, self.deliver, self.session.packet())
+
+    def deliver(self, packet):
+        # Packets still held back when the race ends are dropped with the socket
+        if not self.transport.is_closing():
+            self.transport.sendto(packet, self.peer)
+
+
+async def open_link(sessions, latency=RACE_LATENCY, loss=0):
+    """Binds a loopback UDP endpoint for each session and points them at each other."""
+    loop = asyncio.get_running_loop()
+    protocols = []
+    for session in sessions:
+        _, protocol = await loop.create_datagram_endpoint(
+            lambda session=session: RaceProtocol(session, latency, loss, session.player),
+            local_addr=('127.0.0.1', 0))
+        protocols.append(protocol)
+    for protocol, other in zip(protocols, reversed(protocols)):
+        protocol.peer = other.transport.get_extra_info('sockname')
+    return protocols
+
+
+def make_player(name, player, seed):
+    """Returns a function choosing the action of a player from its own simulation."""
+    if name == 'heuristic':
+        return heuristic_action
+    if name == 'random':
+        return random_player(seed + player)
+    left, right = ((pg.K_LEFT, pg.K_RIGHT), (pg.K_a, pg.K_d))[player]
+
+    def keys(simulation):
+        key = pg.key.get_pressed()
+        return ACTION_LEFT * key[left] | ACTION_RIGHT * key[right]
+    return keys
+
+
+class RaceView:
+    """A class representing the window of one player's side of a race.
+    It draws the local run's tiles and hero, the opponent's hero as a ghost on top,
+    the level of both players and the rollback counters of the session."""
+
+    def __init__(self, session):
+        self.session = session
+        self.screen = pg.display.set_mode((WIDTH, HEIGHT))
+        pg.display.set_caption('Leap of Faith: Race')
+        load_startup_assets(registry)
+        for simulation in (session.local, session.remote):
+            load_hero_assets(registry, simulation.hero_type)
+        self.background = registry.image(TOWER_BG, (WIDTH, HEIGHT), alpha=False)
+        self.hero = Hero(session.local.hero_type, session.local.hero)
+        self.ghost = Hero(session.remote.hero_type, session.remote.hero)
+        self.terrain_images = {}
+        for terrain_type, img_path in TERRAIN.items():
+            if terrain_type in ('conveyor_tile_right', 'conveyor_tile_left'):
+                self.terrain_images[terrain_type] = clip(registry.sheet(
+                    img_path, CONVEYOR_WIDTH, CONVEYOR_HEIGHT, customScale=True,
+                    size=(TERRAIN_WIDTH, TERRAIN_HEIGHT), flipped=terrain_type == 'conveyor_tile_left'))
+            else:
+                self.terrain_images[terrain_type] = registry.image(
+                    img_path, (TERRAIN_WIDTH, TERRAIN_HEIGHT), alpha=False)
+
+    def draw(self):
+        session = self.session
+        local = session.local
+        self.screen.blit(self.background, (0, 0))
+        for terrain in local.terrains:
+            image = self.terrain_images[terrain.type]
+            if not isinstance(image, pg.Surface):
+                image = image.image(local.tick)
+            self.screen.blit(image, terrain.rect)
+
+        # The ghost image is shared with the registry, so a copy is faded
+        self.ghost.update()
+        ghost = self.ghost.image.copy()
+        ghost.set_alpha(GHOST_ALPHA)
+        self.screen.blit(ghost, self.ghost.rect)
+        self.hero.update()
+        self.screen.blit(self.hero.image, self.hero.rect)
+
+        levels = {session.player: local.level, 1 - session.player: session.remote.level}
+        text = f'P1 {levels[0]}   P2 {levels[1]}'
+        self.screen.blit(*render_font(text, WIN_FONT, 'white', (WIDTH // 2, SAW_HEIGHT)))
+        stats = session.stats()
+        text = f'rollbacks {stats["rollbacks"]}  depth {stats["max_depth"]}  stalls {stats["stalls"]}'
+        self.screen.blit(*render_font(text, PROFILER_FONT, 'white', (WIDTH // 2, HEIGHT - SAW_HEIGHT)))
+        if session.finished():
+            winner = session.winner()
+            text = 'Draw' if winner is None else f'Player {winner + 1} wins'
+            self.screen.blit(*render_font(text, SUBTITLE_FONT, 'white', (WIDTH // 2, HEIGHT // 2)))
+        pg.display.update()
+
+
+async def race(players, heroTypes, seed, latency=RACE_LATENCY, loss=0, steps=None, speed=1, show=True):
+    """Runs a race between two sessions on one event loop, stepping both every step time, and returns them.
+    With a window the race runs until it is closed, otherwise until both sides saw it finish, or played
+    the given number of steps and received all of the opponent's."""
+    sessions = [RaceSession(player, heroTypes, seed) for player in (0, 1)]
+    protocols = await open_link(sessions, latency, loss)
+    choose = [make_player(name, player, seed) for player, name in enumerate(players)]
+    view = RaceView(sessions[0]) if show else None
+    loop = asyncio.get_running_loop()
+    step_time = STEP_TIME / 1000 / speed
+    next_step = loop.time()
+    while True:
+        ended = [session.finished() or steps is not None and session.tick >= steps and
+                 len(session.remote_inputs) >= steps for session in sessions]
+        if view is not None:
+            if any(event.type == pg.QUIT for event in pg.event.get()):
+                break
+            view.draw()
+        elif all(ended):
+            break
+        for session, protocol, player, session_ended in zip(sessions, protocols, choose, ended):
+            if not session_ended and (steps is None or session.tick < steps):
+                session.advance(player(session.local))
+            # Inputs are sent every step, also after the end, until the opponent acknowledged them
+            protocol.send()
+        next_step += step_time
+        await asyncio.sleep(max(next_step - loop.time(), 0))
+
+    for protocol in protocols:
+        protocol.transport.close()
+    return sessions, protocols
+
+
+def check(sessions, heroTypes, seed):
+    """Checks that each side's view of both runs matches a replay of the inputs actually played."""
+    replays = []
+    for player, inputs in ((0, sessions[0].local_inputs), (1, sessions[1].local_inputs)):
+        simulation = Simulation(heroTypes[player], seed)
+        for action in inputs:
+            simulation.step(action)
+        replays.append(simulation.snapshot())
+    ok = True
+    for session in sessions:
+        for player, simulation in ((session.player, session.local), (1 - session.player, session.remote)):
+            # Snapshots hold tile objects of their own simulation, so compare everything but those
+            snapshot, replay = simulation.snapshot(), replays[player]
+            if snapshot[:8] != replay[:8] or [entry[2:] for entry in snapshot[8]] != [entry[2:] for entry in replay[8]]:
+                print(f'Player {session.player + 1} sees a different run of player {player + 1}')
+                ok = False
+    return ok
+
+
+def benchmark(steps=2000):
+    """Prints the time to snapshot and restore a simulation in the middle of a run."""
+    simulation = Simulation(HERO_TYPES[0], 1)
+    for _ in range(steps):
+        if simulation.done:
+            simulation.reset()
+        simulation.step(heuristic_action(simulation))
+    runs = 10000
+    start = time.perf_counter()
+    for _ in range(runs):
+        snapshot = simulation.snapshot()
+    snapshot_time = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(runs):
+        simulation.restore(snapshot)
+    restore_time = (time.perf_counter() - start) / runs
+    print(f'snapshot {snapshot_time * 1e6:.1f} us, restore {restore_time * 1e6:.1f} us '
+          f'with {len(simulation.terrains)} tiles')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Two-player race over a loopback UDP link with rollback and input prediction.')
+    parser.add_argument('--players', nargs=2, choices=PLAYERS, default=('keys', 'heuristic'),
+                        help='who plays each side, "keys" being the arrow keys for player 1 and A/D for player 2')
+    parser.add_argument('--heroes', nargs=2, choices=HERO_TYPES, default=HERO_TYPES[:2])
+    parser.add_argument('--seed', type=parse_seed, default=0, help='seed of the tower both players race down')
+    parser.add_argument('--latency', type=float, default=RACE_LATENCY,
+                        help=f'simulated one-way latency in milliseconds, {RACE_LATENCY} by default')
+    parser.add_argument('--loss', type=float, default=0, help='fraction of packets dropped, e.g. 0.1')
+    parser.add_argument('--check', action='store_true',
+                        help='race a heuristic and a random player headlessly at 4x speed over at least 10%% loss '
+                             'and check both sides agree with a replay of the inputs')
+    parser.add_argument('--bench', action='store_true', help='measure snapshot and restore')
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        sys.exit()
+    pg.init()
+    if args.check:
+        players, steps, speed, loss, show = ('heuristic', 'random'), 1200, 4, max(args.loss, 0.1), False
+    else:
+        players, steps, speed, loss, show = args.players, None, 1, args.loss, True
+    sessions, protocols = asyncio.run(race(players, args.heroes, args.seed, args.latency, loss,
+                                           steps, speed, show))
+    for session, protocol in zip(sessions, protocols):
+        print(f'Player {session.player + 1}: {session.stats()}, {protocol.dropped} of {protocol.sent} packets dropped')
+    if all(session.finished() for session in sessions):
+        winner = sessions[0].winner()
+        print('Draw' if winner is None else f'Player {winner + 1} wins')
+    if args.check and not check(sessions, args.heroes, args.seed):
+        sys.exit(1)
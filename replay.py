@@ -0,0 +1,124 @@
+import argparse
+import struct
+import sys
+import time
+from settings import *
+from simulation import Simulation
+
+"""
+The replay module for the "Leap of Faith: The 100-Floor Trials" game. This module records the seed, hero and
+per-step actions of a run into a compact run-length encoded input log, together with a summary of how the run ended.
+Because the simulation is fully determined by its seed and actions, playing a log back reproduces the run exactly,
+so logs can serve as exact bug repros and as performance regression fixtures.
+
+Run "python replay.py run.lof" to play a log back headlessly as fast as possible and verify its outcome,
+or "python LeapOfFaith.py --replay run.lof --speed 4" to watch it at four times the normal speed.
+"""
+
+HERO_TYPES = list(HERO_IDLE)
+CAUSES = [None, 'saw', 'fall', 'spike', 'win']
+
+# Input Log Binary Layout
+LOG_MAGIC = b'LOFI'
+LOG_VERSION = 2  # Version 2 Logs Spawn Terrain From the Level Generator
+HEADER = struct.Struct('<4sBQB')  # Magic, Version, Seed, Hero
+SUMMARY = struct.Struct('<IHIBB')  # Ticks, Level, Fall Distance, Health, Cause
+RUN = struct.Struct('<BH')  # Action, Repeat Count
+MAX_RUN = 0xFFFF
+SEED_LIMIT = 2 ** 64  # Seeds Are Stored as Unsigned 64-bit Integers by Input Logs and State Traces
+
+
+def parse_seed(text):
+    """Parses a --seed argument, rejecting seeds an input log or a state trace can't store."""
+    seed = int(text)
+    if not 0 <= seed < SEED_LIMIT:
+        raise argparse.ArgumentTypeError(f'seed must be between 0 and {SEED_LIMIT - 1}')
+    return seed
+
+
+class InputLog:
+    """A class representing the recorded input of one run.
+    Consecutive identical actions are stored as a single (action, count) run,
+    so a log of a whole run usually takes only a few hundred bytes."""
+
+    def __init__(self, heroType, seed):
+        self.hero_type = heroType
+        self.seed = seed
+        self.runs = []
+        self.summary = None
+
+    def record(self, action):
+        """Appends the action of one simulation step."""
+        if self.runs and self.runs[-1][0] == action and self.runs[-1][1] < MAX_RUN:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([action, 1])
+
+    def actions(self):
+        """Yields the recorded action of every simulation step in order."""
+        for action, count in self.runs:
+            for _ in range(count):
+                yield action
+
+    def finish(self, simulation):
+        """Stores how the recorded run ended, so playback can check it is reproduced exactly."""
+        self.summary = summarize(simulation)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(LOG_MAGIC, LOG_VERSION, self.seed,
+                                HERO_TYPES.index(self.hero_type)))
+            ticks, level, fall_dist, health, cause = self.summary or (
+                0, TOP_LEVEL, 0, MAX_HEALTH, None)
+            f.write(SUMMARY.pack(ticks, level, fall_dist,
+                                 health, CAUSES.index(cause)))
+            f.write(b''.join(RUN.pack(action, count)
+                    for action, count in self.runs))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, seed, hero_index = HEADER.unpack_from(data)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f'{path} is not a version {LOG_VERSION} input log')
+        log = cls(HERO_TYPES[hero_index], seed)
+        ticks, level, fall_dist, health, cause = SUMMARY.unpack_from(
+            data, HEADER.size)
+        log.summary = (ticks, level, fall_dist, health, CAUSES[cause])
+        log.runs = [list(run) for run in RUN.iter_unpack(
+            data[HEADER.size + SUMMARY.size:])]
+        return log
+
+
+def summarize(simulation):
+    """Returns the values that identify how a run ended."""
+    return (simulation.tick, simulation.level, simulation.fall_dist,
+            simulation.hero.health, simulation.cause)
+
+
+def play(log):
+    """Plays a log back headlessly and returns the finished simulation."""
+    simulation = Simulation(log.hero_type, log.seed)
+    for action in log.actions():
+        simulation.step(action)
+    return simulation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Plays an input log back headlessly and checks that the run is reproduced.')
+    parser.add_argument('path', help='input log recorded with LeapOfFaith.py --record')
+    args = parser.parse_args()
+
+    log = InputLog.load(args.path)
+    start = time.perf_counter()
+    simulation = play(log)
+    elapsed = time.perf_counter() - start
+
+    ticks, level, fall_dist, health, cause = summarize(simulation)
+    print(f'{log.hero_type}, seed {log.seed}: {ticks} steps in {elapsed * 1000:.1f} ms '
+          f'({ticks / max(elapsed, 1e-9):.0f} steps per second), level {level}, cause {cause}')
+    if summarize(simulation) != log.summary:
+        print(f'Replay diverged from the recorded run: expected {log.summary}')
+        sys.exit(1)
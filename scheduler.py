@@ -0,0 +1,47 @@
+import heapq
+
+"""
+The scheduler module for the "Leap of Faith: The 100-Floor Trials" game. This module runs delayed actions, such as
+breaking a triggered empty tile or returning to the menu after the hero died, once a given tick is reached.
+Pending actions are kept in a heap ordered by their due tick, so each tick only touches the actions that are due
+and nothing ever blocks the game loop while waiting.
+"""
+
+
+class Scheduler:
+    """A class representing a tick-driven scheduler of delayed actions.
+    Actions due on the same tick run in the order they were scheduled,
+    which keeps simulations deterministic."""
+
+    def __init__(self):
+        self.queue = []
+        self.count = 0
+
+    def schedule(self, tick, action, *args):
+        """Runs action(*args) once the given tick is reached."""
+        heapq.heappush(self.queue, (tick, self.count, action, args))
+        self.count += 1
+
+    def run_due(self, tick):
+        """Runs every action that is due at or before the given tick."""
+        queue = self.queue
+        while queue and queue[0][0] <= tick:
+            _, _, action, args = heapq.heappop(queue)
+            action(*args)
+
+    def clear(self):
+        """Drops every pending action."""
+        self.queue.clear()
+
+    def snapshot(self):
+        """Returns the pending actions and the scheduling counter."""
+        return tuple(self.queue), self.count
+
+    def restore(self, snapshot):
+        """Brings back the pending actions of a snapshot, dropping those scheduled since."""
+        # A copy of the heap list is still a valid heap
+        queue, self.count = snapshot
+        self.queue[:] = queue
+
+    def __len__(self):
+        return len(self.queue)
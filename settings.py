@@ -1,6 +1,3 @@
-import pygame as pg
-pg.init()
-
 """
 The settings module for the "Leap of Faith: The 100-Floor Trials" game. This module contains all the default settings for the gameplay. 
 These settings can be easily accessed and used throughout the game by importing the module into the main game file.
@@ -21,6 +18,11 @@ TOP_LEVEL = 100
 FRAME_INCREMENT = 1
 ANIMATION_INCREMENT = 0.2
 
+# Fixed Timestep, the Game Steps FPS Times per Second Whatever the Render Rate
+STEP_TIME = 1000 / FPS  # Milliseconds per Step
+RENDER_FPS = FPS  # Rendered Frames per Second Cap, 0 Renders Uncapped
+MAX_FRAME_TIME = 250  # Milliseconds Caught Up at Most per Rendered Frame
+
 # Game Dimensions
 WIDTH, HEIGHT = 800, 640  # Game Window Display Dimensions
 GAMENAME_HEIGHT = 100  # Game Name Height
@@ -46,20 +48,27 @@ HUD_NUMBER_OFFSET_X, HUD_NUMBER_OFFSET_Y = 20, 80
 COLLISION_THRESHOLD = 10  # Collision Threshold
 CONVEYOR_WIDTH, CONVEYOR_HEIGHT = 49, 12  # Convetor Tile's Dimensions
 
-# Font
-LEVEL_FONT = pg.font.SysFont('comicsans', 50)
-TITLE_FONT = pg.font.SysFont('comicsans', 100)
-SUBTITLE_FONT = pg.font.SysFont('comicsans', 50)
-WIN_FONT = pg.font.SysFont('comicsans', 25)
+# Font (System Font Name, Size), Resolved on First Use by the Asset Registry
+LEVEL_FONT = ('comicsans', 50)
+TITLE_FONT = ('comicsans', 100)
+SUBTITLE_FONT = ('comicsans', 50)
+WIN_FONT = ('comicsans', 25)
+PROFILER_FONT = ('comicsans', 18)
+FONT_CACHE = 'assets/fonts.json'  # Resolved Font Files, So Later Launches Skip the System Font Scan
+TEXT_CACHE_SIZE = 64  # Rendered Strings Kept by the Text Cache
 
-# Game Events
-TERRAIN_SPAWN = pg.USEREVENT + 1
-HERO_DIE = pg.USEREVENT + 2
+# Hero Actions
+ACTION_IDLE, ACTION_LEFT, ACTION_RIGHT = 0, 1, 2
 
 # Spawn Frequence and Delay Time
 TERRAIN_SPAWN_FREQ = 1000
 DELAY_TIME = 3000
 EMPTY_TILE_TRIGGER_TIME = 1000
+# Simulation Steps Between Terrain Spawns and Before an Empty Tile Breaks
+TERRAIN_SPAWN_TICKS = TERRAIN_SPAWN_FREQ * FPS // 1000
+EMPTY_TILE_TRIGGER_TICKS = EMPTY_TILE_TRIGGER_TIME * FPS // 1000
+# Frames Before Returning to the Menu After the Hero Died
+DELAY_FRAMES = DELAY_TIME * FPS // 1000
 
 # Image Path
 BACKGROUND = 'assets/background/Gray.png'
@@ -101,6 +110,50 @@ TERRAIN = {
 }
 TERRAIN_SPAWN_WEIGHTS = [40, 20, 10, 10, 10, 10]
 
+# Level Generation, Spawns Drawn per Chunk, Kept Buffered Ahead of the Camera and Draws per Chunk Before Giving Up
+LEVEL_CHUNK_SIZE = 8
+LEVEL_LOOKAHEAD = 8
+LEVEL_MAX_ATTEMPTS = 20
+LEVEL_MAX_SKIP = 3  # Tiles the Reachability Pass Lets the Hero Fall Past
+
+# Sprite Atlas Path
+USE_ATLAS = True
+ATLAS_PATH = 'assets/atlas.bin'
+ATLAS_INDEX = 'assets/atlas.json'
+
+# Worker Threads Decoding Images and Sounds Behind the Loading Screen
+LOADER_WORKERS = 4
+
+# Display Update Mode, 'dirty' Pushes Only Changed Regions and 'full' Flips the Whole Window
+DISPLAY_MODE = 'dirty'
+
+# Canvas Mode, 'full' Draws on the Window and 'native' on a Canvas at Art Resolution, Upscaled by Its Integer Scale
+CANVAS_MODE = 'full'
+CANVAS_SCALES = {'full': 1, 'native': 2}
+
+# Frames Kept by the Profiler's Ring Buffer
+PROFILER_FRAMES = 600
+
+# Quality Levels From Best to Cheapest, Each Adding to the One Before: Frozen Saw and Conveyor Animation, a Backdrop
+# Flat in Its Average Color With Still Walls, and the HUD Recomputed Every Other Frame. 'auto' Lets the Governor Choose
+QUALITY_LEVELS = ('full', 'frozen', 'flat', 'sparse_hud')
+QUALITY_MODE = 'auto'
+# Quality Governor, Frames in the Moving Window, Fraction of the Frame Budget the Mean Frame Time Must Stay Under
+# Before Stepping Up, and the Most Frames Waited Before Retrying a Step Up That Had to Be Undone
+GOVERNOR_WINDOW = FPS // 2
+GOVERNOR_HEADROOM = 0.5
+GOVERNOR_MAX_PATIENCE = 32 * FPS
+
+# Two-Player Race, Simulated One-Way Latency in Milliseconds, Unacknowledged Inputs Resent per Packet
+# and Steps the Opponent's Inputs Are Predicted Ahead Before a Side Stalls
+RACE_LATENCY = 100
+RACE_RESEND = 64
+RACE_ROLLBACK = FPS
+
+# State Trace, Steps Kept by the Ring File and Steps Between Flushes
+TRACE_FRAMES = 36000  # Ten Minutes at FPS Steps per Second
+TRACE_FLUSH = FPS
+
 # Sound Path
 HEAL_SOUND = 'assets/sound/heal.wav'
 STING_SOUND = 'assets/sound/sting.ogg'
@@ -109,3 +162,17 @@ NINJAFROG_SOUND = 'assets/sound/ninjafrog.ogg'
 PINKMAN_SOUND = 'assets/sound/pinkman.ogg'
 BREAK_SOUND = 'assets/sound/break.flac'
 BGM = 'assets/sound/Juhani Junkala.wav'
+
+# Sound Effects by Name, With Their File and Channel Category
+SOUND_EFFECTS = {
+    'heal': (HEAL_SOUND, 'heal'),
+    'sting': (STING_SOUND, 'damage'),
+    'break': (BREAK_SOUND, 'break'),
+    'maskdude': (MASKDUDE_SOUND, 'voice'),
+    'ninjafrog': (NINJAFROG_SOUND, 'voice'),
+    'pinkman': (PINKMAN_SOUND, 'voice'),
+}
+
+# Audio Bank, Decoded Sound Cache and Mixer Channels Reserved per Effect Category
+AUDIO_CACHE = 'assets/audio_cache'
+SOUND_CHANNELS = {'voice': 1, 'damage': 2, 'heal': 2, 'break': 3}
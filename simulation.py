@@ -0,0 +1,697 @@
+import argparse
+import time
+from random import Random
+import pygame as pg
+from settings import *
+from assets import registry
+from animation import TICK_FRAMES, WRAP_TICKS
+from levels import TERRAIN_TYPES, LevelGenerator
+from scheduler import Scheduler
+
+"""
+The simulation module for the "Leap of Faith: The 100-Floor Trials" game. This module contains the game rules
+without any drawing: terrain spawning and scrolling, hero movement, collision, damage, healing, breaking tiles
+and level progress. A simulation never touches the display, so it can be stepped thousands of times per second
+by bots, soak tests and tuning sweeps, while the game window only draws its state.
+
+A step normally lasts one tick of the 60 FPS game, but can also cover several ticks for fast-forward and batch runs.
+Such long steps move far enough to pass through a tile, so they sweep a box around the hero along its movement to find
+the first tick it could touch a tile in. The ticks before it are advanced at once, and the rest one by one with the
+collision of the 60 FPS game, so a long step ends exactly where that many single ticks would.
+
+Run "python simulation.py" to measure how many steps per second the simulation reaches, or
+"python simulation.py --step-ticks 4" to measure steps of four ticks each. "python simulation.py --check" checks that
+long steps end exactly like as many single ticks, from every state of a few runs.
+"""
+
+HERO_SHEETS = {'idle': HERO_IDLE, 'run': HERO_RUN,
+               'fall': HERO_FALL, 'hit': HERO_HIT}
+
+# Shared Full Masks of Terrain Overlap Areas
+full_masks = {}
+# Shared Boxes Around the Visible Pixels of All Frames of Every Hero
+hero_hulls = {}
+
+
+def full_mask(size):
+    """Returns a shared, completely filled mask of the given size."""
+    mask = full_masks.get(size)
+    if mask is None:
+        mask = full_masks[size] = pg.mask.Mask(size, fill=True)
+    return mask
+
+
+def hero_masks(heroType):
+    """Returns the shared collision mask of every hero frame, keyed by animation state and direction."""
+    masks = {}
+    for state, sheets in HERO_SHEETS.items():
+        for direction in ('left', 'right'):
+            masks[(state, direction)] = registry.sheet_masks(
+                sheets[heroType], HERO_WIDTH, HERO_HEIGHT, True, flipped=direction == 'left')
+    return masks
+
+
+def hero_hull(heroType):
+    """Returns the box around the visible pixels of every frame of a hero, relative to the frame.
+    No mask of the hero reaches outside it, so a tile the box doesn't overlap can't collide with the hero."""
+    hull = hero_hulls.get(heroType)
+    if hull is None:
+        rects = [rect for masks in hero_masks(heroType).values() for mask in masks
+                 for rect in mask.get_bounding_rects()]
+        hull = hero_hulls[heroType] = rects[0].unionall(rects[1:])
+    return hull
+
+
+def sweep(box, dx, dy, target):
+    """Returns when a box moving by (dx, dy) first touches the target rect, as a fraction of the move,
+    or None if it misses the target. A box already overlapping the target touches it at once.
+    Touching means the edges meet, the box only overlaps the target after that."""
+    if dx > 0:
+        entry_x, exit_x = (target.left - box.right) / dx, (target.right - box.left) / dx
+    elif dx < 0:
+        entry_x, exit_x = (target.right - box.left) / dx, (target.left - box.right) / dx
+    elif box.right <= target.left or box.left >= target.right:
+        return None
+    else:
+        entry_x, exit_x = float('-inf'), float('inf')
+    if dy > 0:
+        entry_y, exit_y = (target.top - box.bottom) / dy, (target.bottom - box.top) / dy
+    elif dy < 0:
+        entry_y, exit_y = (target.bottom - box.top) / dy, (target.top - box.bottom) / dy
+    elif box.bottom <= target.top or box.top >= target.bottom:
+        return None
+    else:
+        entry_y, exit_y = float('-inf'), float('inf')
+
+    entry, leave = max(entry_x, entry_y), min(exit_x, exit_y)
+    # A box already past the target, or moving away from it, doesn't touch it
+    if entry >= leave or entry > 1 or leave <= 0:
+        return None
+    return max(entry, 0)
+
+
+def terrain_masks():
+    """Returns the shared collision mask of every terrain type, or None for tiles that fill their whole rectangle."""
+    masks = {}
+    for terrain_type, img_path in TERRAIN.items():
+        if terrain_type in ('conveyor_tile_right', 'conveyor_tile_left'):
+            # All conveyor frames share the same outline
+            masks[terrain_type] = registry.sheet_masks(
+                img_path, CONVEYOR_WIDTH, CONVEYOR_HEIGHT, customScale=True,
+                size=(TERRAIN_WIDTH, TERRAIN_HEIGHT), flipped=terrain_type == 'conveyor_tile_left')[0]
+        else:
+            masks[terrain_type] = None
+    return masks
+
+
+def first_terrain_from(terrains, top, lo=0):
+    """Returns the index of the first terrain of a top-sorted list whose top edge is at or below the given y."""
+    hi = len(terrains)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if terrains[mid].rect.top < top:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class HeroState:
+    """A class representing the state of the Hero inside the simulation.
+    It keeps the hero's position, health, direction and animation state,
+    and moves the hero according to the action chosen for each step."""
+
+    def __init__(self, heroType, frame_counts, maxHealth=MAX_HEALTH):
+        self.type = heroType
+        self.frame_counts = frame_counts
+        # Ticks since the current animation started, wrapping at the tick the float counter reached the sheet length
+        self.animation_tick = 0
+        self.wrap_ticks = {state: WRAP_TICKS[count] for state, count in frame_counts.items()}
+        self.cutscene_played = False
+        self.health = maxHealth
+        self.direction = 'left'
+        self.run = False
+        self.fall = False
+        self.hit = False
+        self.state = 'appear'
+        self.frame = 0
+        self.rect = pg.Rect(0, 0, CUTSCENE_WIDTH * 2, CUTSCENE_HEIGHT * 2)
+        self.rect.midbottom = (HERO_X, HERO_Y)
+
+    def snapshot(self):
+        """Returns the hero's changing state as a tuple."""
+        rect = self.rect
+        return (self.animation_tick, self.cutscene_played, self.health, self.direction, self.run,
+                self.fall, self.hit, self.state, self.frame, rect.x, rect.y, rect.w, rect.h)
+
+    def restore(self, snapshot):
+        """Brings the hero back to the state of a snapshot, keeping its rect object."""
+        (self.animation_tick, self.cutscene_played, self.health, self.direction, self.run,
+         self.fall, self.hit, self.state, self.frame, x, y, w, h) = snapshot
+        self.rect.update(x, y, w, h)
+
+    def hero_appear(self):
+        if self.animation_tick >= self.wrap_ticks['appear']:
+            self.animation_tick = 0
+            self.cutscene_played = True
+            self.state = 'idle'
+            self.frame = 0
+            self.rect = pg.Rect(0, 0, HERO_WIDTH * 2, HERO_HEIGHT * 2)
+            self.rect.midbottom = (HERO_X, HERO_Y)
+        else:
+            self.frame = TICK_FRAMES[self.animation_tick]
+
+    def hero_run(self, action, ticks=1):
+        # Each tick moves a whole MOVING_SPEED, so a long step stops at the last tick that fits before the wall
+        if action & ACTION_LEFT and (moves := min(ticks, (self.rect.left - WALL_WIDTH) // MOVING_SPEED)) > 0:
+            self.run = True
+            self.direction = 'left'
+            self.rect.x -= MOVING_SPEED * moves
+        elif action & ACTION_RIGHT and \
+                (moves := min(ticks, (WIDTH - WALL_WIDTH - self.rect.right) // MOVING_SPEED)) > 0:
+            self.run = True
+            self.direction = 'right'
+            self.rect.x += MOVING_SPEED * moves
+        else:
+            self.run = False
+
+    def hero_fall(self, ticks=1):
+        if self.fall:
+            self.rect.y += FALL_SPEED * ticks
+
+    def hero_die(self):
+        """Returns the cause of death if the hero touched the saws or fell out of the tower."""
+        if self.rect.top <= SAW_HEIGHT // 3:
+            self.health = 0
+            return 'saw'
+        if self.rect.top >= HEIGHT:
+            self.health = 0
+            return 'fall'
+        return None
+
+    def animation(self):
+        if self.hit:
+            state = 'hit'
+        elif self.fall:
+            state = 'fall'
+        elif self.run:
+            state = 'run'
+        else:
+            state = 'idle'
+
+        if self.animation_tick >= self.wrap_ticks[state]:
+            if state == 'hit':
+                self.hit = False
+            self.animation_tick = 0
+        self.state = state
+        self.frame = TICK_FRAMES[self.animation_tick]
+
+
+class TerrainState:
+    """A class representing the state of a Terrain tile inside the simulation.
+    It keeps the tile's type, position and whether its effect has already been applied.
+    Tiles are recycled through a TerrainPool, so the generation counts how often this instance
+    has been reused and tells holders of an old reference that their tile is gone."""
+
+    __slots__ = ('type', 'has_dealt_damage', 'has_dealt_heal', 'has_trigger',
+                 'alive', 'rect', 'generation')
+
+    def __init__(self, terrainType, pos):
+        self.rect = pg.Rect(0, 0, TERRAIN_WIDTH, TERRAIN_HEIGHT)
+        self.generation = 0
+        self.reset(terrainType, pos)
+
+    def reset(self, terrainType, pos):
+        self.type = terrainType
+        self.has_dealt_damage = False
+        self.has_dealt_heal = False
+        self.has_trigger = False
+        self.alive = True
+        self.rect.midtop = pos
+
+    def terrain_move(self, ticks=1):
+        self.rect.y -= TERRAIN_SPEED * ticks
+
+
+class TerrainPool:
+    """A class representing the pool of recycled terrain states.
+    Tiles that scrolled off-screen or broke are released into the pool and handed out again
+    by the next spawns with their state reset, so long and dense runs stop allocating new tiles.
+    Creation, reuse and release counters are kept to check how well the pool is recycling."""
+
+    def __init__(self):
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self.released = 0
+
+    def acquire(self, terrainType, pos):
+        """Returns a tile of the given type and position, reusing a released one if possible."""
+        if self.free:
+            self.reused += 1
+            terrain = self.free.pop()
+            terrain.generation += 1
+            terrain.reset(terrainType, pos)
+            return terrain
+        self.created += 1
+        return TerrainState(terrainType, pos)
+
+    def release(self, terrain):
+        """Returns a destroyed tile to the pool."""
+        terrain.alive = False
+        self.released += 1
+        self.free.append(terrain)
+
+    def stats(self):
+        """Returns the size and reuse counters of the pool."""
+        acquired = self.created + self.reused
+        return {
+            'created': self.created,
+            'reused': self.reused,
+            'released': self.released,
+            'free': len(self.free),
+            'reuse_rate': self.reused / acquired if acquired else 0,
+        }
+
+
+class Simulation:
+    """Headless simulation of one game of Leap of Faith.
+    Each call to step(action) advances the game by one frame and returns the events that happened,
+    such as ('spawn', terrain), ('damage', None), ('heal', None), ('break', terrain), ('die', cause) and ('win', None).
+    Actions are combinations of ACTION_LEFT and ACTION_RIGHT, or ACTION_IDLE.
+    Terrain spawns come from a seeded LevelGenerator, so a run is fully determined by its seed and actions.
+    A new terrain spawns every spawnTicks steps; lowering it raises the terrain density, e.g. for stress tests.
+    The spawn weights and the hero's health can be changed the same way, e.g. by tuning sweeps.
+    Each step lasts stepTicks ticks of the 60 FPS game and ends exactly where that many single steps would;
+    the ticks in which the hero falls freely are advanced at once."""
+
+    def __init__(self, heroType='MaskDude', seed=None, spawnTicks=TERRAIN_SPAWN_TICKS,
+                 spawnWeights=TERRAIN_SPAWN_WEIGHTS, maxHealth=MAX_HEALTH, stepTicks=1):
+        self.levels = LevelGenerator(spawnTicks=spawnTicks, weights=spawnWeights, maxHealth=maxHealth)
+        self.spawn_ticks = spawnTicks
+        self.max_health = maxHealth
+        self.set_step_ticks(stepTicks)
+        self.pool = TerrainPool()
+        self.scheduler = Scheduler()
+        self.terrains = []
+        self.reset(heroType, seed)
+
+    def set_step_ticks(self, stepTicks):
+        """Sets the ticks covered by each step."""
+        self.step_ticks = stepTicks
+
+    def reset(self, heroType=None, seed=None, spawnTicks=None):
+        """Starts a new run, drawing a fresh seed unless one is given, and keeping the spawn interval unless one is."""
+        self.seed = Random().randrange(2 ** 32) if seed is None else seed
+        if spawnTicks is not None:
+            self.spawn_ticks = spawnTicks
+        self.levels.reset(self.seed, self.spawn_ticks)
+
+        if heroType is not None:
+            self.hero_type = heroType
+            self.masks = hero_masks(heroType)
+            self.hull = hero_hull(heroType)
+            self.terrain_masks = terrain_masks()
+            self.frame_counts = {state: len(frames) for (state, direction), frames
+                                 in self.masks.items()}
+            self.frame_counts['appear'] = len(registry.sheet(
+                HERO_APPEAR, CUTSCENE_WIDTH, CUTSCENE_HEIGHT, True))
+
+        self.tick = 0
+        self.level = TOP_LEVEL
+        self.fall_dist = 0
+        self.hero_prevPos = HERO_Y
+        self.done = False
+        self.cause = None
+        self.events = []
+        self.scheduler.clear()
+        self.hero = HeroState(self.hero_type, self.frame_counts, self.max_health)
+        for terrain in self.terrains:
+            self.pool.release(terrain)
+        self.terrains = [self.pool.acquire('common_tile', (WIDTH // 2, HEIGHT))]
+
+    def step(self, action=ACTION_IDLE):
+        """Advances the simulation by one step and returns the list of events of this step.
+        A long step first advances at once through the ticks free_ticks() finds the hero can't touch a tile in,
+        and runs the rest tick by tick with the collision of the 60 FPS game, so it ends exactly where
+        that many single ticks would."""
+        self.events = []
+        if self.done:
+            return self.events
+        ticks = self.step_ticks
+        if ticks > 1 and (free := self.free_ticks(action, ticks)):
+            self.advance(action, free)
+            ticks -= free
+        for _ in range(ticks):
+            if self.done:
+                break
+            self.advance(action)
+        return self.events
+
+    def free_ticks(self, action, ticks):
+        """Returns how many of the next ticks the hero falls through without touching a tile, dying or winning.
+        The hull of the hero is swept along its movement relative to the tiles, and the ticks before the first
+        tile it would overlap are free. The count also stops short of the wall the hero runs into,
+        the bottom of the tower and the last floor, so none of them is passed within the free ticks."""
+        hero = self.hero
+        if not hero.cutscene_played or not hero.fall:
+            return 0
+        rect = hero.rect
+        if rect.top <= SAW_HEIGHT // 3:
+            return 0
+        # A hero whose top is below the screen at the start of a tick dies in it, and the last floor wins
+        ticks = min(ticks, (HEIGHT - rect.top - 1) // FALL_SPEED + 1,
+                    (TOP_LEVEL * HEIGHT - self.fall_dist - 1) // FALL_SPEED + 1)
+        # Run like hero_run() does, as long as there is room for every tick
+        left, right = (rect.left - WALL_WIDTH) // MOVING_SPEED, (WIDTH - WALL_WIDTH - rect.right) // MOVING_SPEED
+        if action & ACTION_LEFT and left > 0:
+            dx, ticks = -MOVING_SPEED, min(ticks, left)
+        elif action & ACTION_RIGHT and right > 0:
+            dx, ticks = MOVING_SPEED, min(ticks, right)
+        else:
+            dx = 0
+        dy = FALL_SPEED + TERRAIN_SPEED
+
+        # Tiles spawning in these ticks aren't there yet, so the hero must stay clear of the bottom of the screen
+        box = self.hull.move(rect.topleft)
+        due = self.spawn_ticks - self.tick % self.spawn_ticks
+        if due <= ticks and box.bottom + FALL_SPEED * ticks >= HEIGHT - TERRAIN_SPEED * ticks:
+            ticks = due - 1
+        if ticks <= 0:
+            return 0
+        end = box.move(dx * ticks, dy * ticks)
+        for terrain in self.nearby_terrains(box.union(end)):
+            contact = sweep(box, dx * ticks, dy * ticks, terrain.rect)
+            if contact is not None:
+                # The box overlaps the tile only after the tick it touches it in
+                ticks = min(ticks, int(contact * ticks))
+        return ticks
+
+    def advance(self, action, ticks=1):
+        """Advances the simulation by the given number of ticks. Several ticks are only advanced at once
+        when free_ticks() found them free, and skip the collision, as nothing can collide in them."""
+        previous = self.tick
+        self.tick += ticks
+
+        # Spawn Terrain, Tiles Due Before the Last Tick Starting Where They Would Have Scrolled To
+        if self.tick % self.spawn_ticks < ticks:
+            for tick in range(previous + self.spawn_ticks - previous % self.spawn_ticks, self.tick + 1,
+                              self.spawn_ticks):
+                self.spawn_terrain(HEIGHT + (tick - previous - 1) * TERRAIN_SPEED)
+
+        # Update Terrains
+        for terrain in self.terrains:
+            terrain.terrain_move(ticks)
+            if terrain.rect.y <= -TERRAIN_HEIGHT:
+                self.pool.release(terrain)
+        self.terrains = [
+            terrain for terrain in self.terrains if terrain.alive]
+
+        # Update Hero
+        hero = self.hero
+        if not hero.cutscene_played:
+            hero.animation_tick += ticks
+            hero.hero_appear()
+        else:
+            if cause := hero.hero_die():
+                self.die(cause)
+            hero.hero_fall(ticks)
+            hero.hero_run(action, ticks)
+            # The animation moves on tick by tick, as it can wrap or end the hit animation on any of them
+            for _ in range(ticks):
+                hero.animation_tick += 1
+                hero.animation()
+
+        # Perform Collision Detection, Calculate Falling Distance and Break Due Empty Tiles
+        if hero.cutscene_played:
+            if ticks == 1:
+                self.collision()
+            self.cal_fallDist()
+            self.scheduler.run_due(self.tick)
+
+        # Update Level
+        self.level = TOP_LEVEL - self.fall_dist // HEIGHT
+        if self.level == 0 and not self.done:
+            self.done = True
+            self.cause = 'win'
+            self.events.append(('win', None))
+
+    def snapshot(self):
+        """Returns the whole changing state of the run as nested tuples, cheap enough to take every step.
+        Tiles are kept by reference along with their fields, so a restore brings back the same tile objects
+        that pending breaks and the game's sprites refer to."""
+        return (self.seed, self.tick, self.level, self.fall_dist, self.hero_prevPos, self.done, self.cause,
+                self.hero.snapshot(),
+                tuple((terrain, terrain.generation, terrain.type, terrain.has_dealt_damage,
+                       terrain.has_dealt_heal, terrain.has_trigger, terrain.rect.x, terrain.rect.y)
+                      for terrain in self.terrains),
+                self.scheduler.snapshot(), self.levels.snapshot())
+
+    def restore(self, snapshot):
+        """Brings the run back to the state of a snapshot taken from this simulation.
+        Tiles spawned since are released to the pool and tiles released since are taken back from it."""
+        (self.seed, self.tick, self.level, self.fall_dist, self.hero_prevPos, self.done, self.cause,
+         hero, terrains, pending, levels) = snapshot
+        self.events = []
+        self.hero.restore(hero)
+        previous = self.terrains
+        for terrain in previous:
+            terrain.alive = False
+        self.terrains = []
+        for terrain, generation, terrain_type, damage, heal, trigger, x, y in terrains:
+            terrain.generation = generation
+            terrain.type = terrain_type
+            terrain.has_dealt_damage = damage
+            terrain.has_dealt_heal = heal
+            terrain.has_trigger = trigger
+            terrain.alive = True
+            terrain.rect.topleft = (x, y)
+            self.terrains.append(terrain)
+        pool = self.pool
+        pool.free = [terrain for terrain in pool.free if not terrain.alive]
+        pool.free.extend(terrain for terrain in previous if not terrain.alive)
+        self.scheduler.restore(pending)
+        self.levels.restore(levels)
+
+    def spawn_terrain(self, y=HEIGHT):
+        terrain_type, x = self.levels.next_spawn()
+        terrain = self.pool.acquire(terrain_type, (x, y))
+        self.terrains.append(terrain)
+        self.events.append(('spawn', terrain))
+
+    def die(self, cause):
+        if not self.done:
+            self.done = True
+            self.cause = cause
+            self.events.append(('die', cause))
+
+    def overlaps(self, terrain):
+        """Checks whether the visible pixels of the hero's current frame overlap those of the terrain."""
+        hero = self.hero
+        clip = hero.rect.clip(terrain.rect)
+        if not clip:
+            return False
+        mask = self.masks[(hero.state, hero.direction)][hero.frame]
+        terrain_mask = self.terrain_masks[terrain.type]
+        if terrain_mask is None:
+            return mask.overlap(full_mask(clip.size),
+                                (clip.x - hero.rect.x, clip.y - hero.rect.y)) is not None
+        return mask.overlap(terrain_mask, (terrain.rect.x - hero.rect.x,
+                                           terrain.rect.y - hero.rect.y)) is not None
+
+    def cal_damage(self):
+        self.hero.hit = True
+        self.hero.health -= 1
+        self.events.append(('damage', None))
+        if self.hero.health <= 0:
+            self.die('spike')
+
+    def cal_heal(self):
+        if self.hero.health < self.max_health:
+            self.hero.health += 1
+            self.events.append(('heal', None))
+
+    def cal_fallDist(self):
+        if (dist := self.hero.rect.bottom - self.hero_prevPos) > 0:
+            self.fall_dist += dist
+        self.hero_prevPos = self.hero.rect.bottom
+
+    def empty_tile_destroy(self, terrain, generation):
+        """Breaks a triggered empty tile, scheduled EMPTY_TILE_TRIGGER_TICKS after the hero landed on it."""
+        # A tile that already scrolled away may have been recycled as a new one
+        if terrain.alive and terrain.generation == generation:
+            self.terrains.remove(terrain)
+            self.pool.release(terrain)
+        self.events.append(('break', terrain))
+
+    def nearby_terrains(self, rect):
+        """Returns the terrains whose rows overlap the given rect, in spawn order.
+        The terrain list stays sorted by top edge because every tile rises at the same speed
+        and new tiles spawn below the others, so the range is found by bisection."""
+        first = first_terrain_from(self.terrains, rect.top - TERRAIN_HEIGHT + 1)
+        last = first_terrain_from(self.terrains, rect.bottom, first)
+        return self.terrains[first:last]
+
+    def land(self, terrain):
+        """Stands the hero on top of a terrain and applies the terrain's effect."""
+        hero = self.hero
+        hero.rect.bottom = terrain.rect.top
+        hero.fall = False
+        # If the terrain is a spike_tile and hasn't dealt damage yet, apply damage
+        if terrain.type == 'spike_tile' and not terrain.has_dealt_damage:
+            self.cal_damage()
+            terrain.has_dealt_damage = True
+        # If the terrain is a heal_tile and hasn't healed yet, apply healing
+        elif terrain.type == 'heal_tile' and not terrain.has_dealt_heal:
+            self.cal_heal()
+            terrain.has_dealt_heal = True
+        elif terrain.type == 'empty_tile' and not terrain.has_trigger:
+            self.scheduler.schedule(self.tick + EMPTY_TILE_TRIGGER_TICKS,
+                                    self.empty_tile_destroy, terrain, terrain.generation)
+            terrain.has_trigger = True
+        elif terrain.type == 'conveyor_tile_left':
+            hero.rect.x -= CONVEYOR_SPEED
+        elif terrain.type == 'conveyor_tile_right':
+            hero.rect.x += CONVEYOR_SPEED
+
+    def collision(self):
+        hero = self.hero
+        for terrain in self.nearby_terrains(hero.rect):
+            if self.overlaps(terrain):
+                # Check if hero hits the top of the terrain
+                if hero.rect.bottom <= terrain.rect.top + COLLISION_THRESHOLD:
+                    self.land(terrain)
+
+                # Check if hero hits the sides of the terrain
+                else:
+                    if hero.rect.left < terrain.rect.left:
+                        hero.rect.right = terrain.rect.left
+                    elif hero.rect.right > terrain.rect.right:
+                        hero.rect.left = terrain.rect.right
+                    hero.fall = True
+                break
+        else:
+            # If no collision was detected, set the hero's fall state to True
+            hero.fall = True
+
+
+def heuristic_action(simulation):
+    """Returns the action of a simple player that drops towards the highest reachable tile below the hero,
+    preferring any other tile to a spike tile."""
+    hero = simulation.hero.rect
+    standing = None
+    below = []
+    for terrain in simulation.terrains:
+        rect = terrain.rect
+        if abs(rect.top - hero.bottom) <= COLLISION_THRESHOLD and rect.left < hero.right and rect.right > hero.left:
+            standing = terrain
+        elif rect.top > hero.bottom + COLLISION_THRESHOLD:
+            below.append((terrain.type == 'spike_tile', rect))
+
+    # A standing hero can drop off either side of its tile if there is room next to the wall
+    if standing is not None:
+        origins = []
+        if standing.rect.left - WALL_WIDTH >= HERO_WIDTH * 2:
+            origins.append((ACTION_LEFT, standing.rect.left - HERO_WIDTH))
+        if WIDTH - WALL_WIDTH - standing.rect.right >= HERO_WIDTH * 2:
+            origins.append((ACTION_RIGHT, standing.rect.right + HERO_WIDTH))
+    else:
+        origins = [(ACTION_IDLE, hero.centerx)]
+
+    # The hero closes in on a tile below at the fall speed plus the terrain speed, so prefer
+    # reachable tiles, then non-spike tiles, then the highest one; otherwise the nearest miss
+    best = None
+    for action, x in origins:
+        for spike, rect in below:
+            steps = (rect.top - hero.bottom) // (FALL_SPEED + TERRAIN_SPEED)
+            distance = max(rect.left + HERO_WIDTH // 2 - x, x - rect.right + HERO_WIDTH // 2, 0)
+            shortfall = distance - steps * MOVING_SPEED
+            key = (shortfall > 0, spike, rect.top if shortfall <= 0 else shortfall)
+            if best is None or key < best[0]:
+                best = (key, action, rect)
+
+    if standing is not None:
+        reachable, spike = best is not None and not best[0][0], best is not None and best[0][1]
+        if reachable and not (spike and hero.top > HEIGHT // 4):
+            return best[1]
+        # Nothing good is reachable yet, so wait in the middle of the tile unless the saws get close
+        if hero.top > HEIGHT // 4 or not origins:
+            if hero.centerx < standing.rect.centerx - MOVING_SPEED:
+                return ACTION_RIGHT
+            if hero.centerx > standing.rect.centerx + MOVING_SPEED:
+                return ACTION_LEFT
+            return ACTION_IDLE
+        return origins[0][0]
+
+    if best is None:
+        return ACTION_IDLE
+    target = best[2]
+    if hero.centerx < target.left + HERO_WIDTH:
+        return ACTION_RIGHT
+    if hero.centerx > target.right - HERO_WIDTH:
+        return ACTION_LEFT
+    return ACTION_IDLE
+
+
+def check_steps(stepTicks=4, seeds=range(1, 6), heroType='MaskDude'):
+    """Plays runs with the heuristic player one tick per step, and from every state on the way, checks that
+    one step of stepTicks ticks with each action ends exactly like that many single ticks, events included.
+    Raises an AssertionError at the first difference and returns the number of steps checked."""
+    def state(simulation, events):
+        return (simulation.hero.snapshot(), simulation.tick, simulation.fall_dist, simulation.level,
+                simulation.done, simulation.cause, sorted(name for name, _ in events),
+                [(terrain.type, terrain.rect.topleft, terrain.has_dealt_damage, terrain.has_dealt_heal,
+                  terrain.has_trigger) for terrain in simulation.terrains])
+
+    checked = 0
+    for seed in seeds:
+        simulation = Simulation(heroType, seed)
+        while not simulation.done:
+            snapshot = simulation.snapshot()
+            for action in (ACTION_IDLE, ACTION_LEFT, ACTION_RIGHT):
+                results = []
+                for ticks, steps in ((1, stepTicks), (stepTicks, 1)):
+                    simulation.restore(snapshot)
+                    simulation.set_step_ticks(ticks)
+                    events = []
+                    for _ in range(steps):
+                        events.extend(simulation.step(action))
+                    results.append(state(simulation, events))
+                assert results[0] == results[1], \
+                    f'seed {seed} tick {snapshot[1]} action {action} differs:\n{results[0]}\n{results[1]}'
+                checked += 1
+            simulation.restore(snapshot)
+            simulation.set_step_ticks(1)
+            simulation.step(heuristic_action(simulation))
+    return checked
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures how many steps per second the simulation reaches.')
+    parser.add_argument('--step-ticks', type=int, default=1,
+                        help='ticks of the 60 FPS game covered by each step, 1 by default')
+    parser.add_argument('--check', action='store_true',
+                        help='check that steps of --step-ticks ticks (4 if not given) end exactly like as many '
+                             'single ticks, from every state of a few runs')
+    args = parser.parse_args()
+
+    if args.check:
+        step_ticks = args.step_ticks if args.step_ticks > 1 else 4
+        checked = check_steps(step_ticks)
+        print(f'{checked} steps of {step_ticks} ticks match single ticks')
+    else:
+        simulation = Simulation(stepTicks=args.step_ticks)
+        actions = (ACTION_IDLE, ACTION_LEFT, ACTION_RIGHT)
+        steps = games = ticks = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 3:
+            action = actions[(simulation.tick // 30) % len(actions)]
+            simulation.step(action)
+            steps += 1
+            if simulation.done:
+                games += 1
+                ticks += simulation.tick
+                simulation.reset()
+        elapsed = time.perf_counter() - start
+        ticks += simulation.tick
+        print(f'{steps / elapsed:.0f} steps per second, {ticks / elapsed:.0f} ticks per second '
+              f'over {games} finished games')
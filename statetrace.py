@@ -0,0 +1,209 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from settings import *
+from replay import CAUSES, HERO_TYPES
+from levels import TERRAIN_TYPES
+
+"""
+The state trace module for the "Leap of Faith: The 100-Floor Trials" game. This module records what the simulation
+did on every step of a long session, to study rare collision glitches such as the hero being pushed through a tile
+by a side hit or a conveyor pushing it into a wall. Each step is packed into one fixed-size binary record: the action,
+the step's events, the hero's rect, state, health and fall distance, and the rect and type of every live tile.
+Records go straight into a preallocated, memory-mapped ring file that keeps the last TRACE_FRAMES steps, and the
+file is only flushed every TRACE_FLUSH records, so recording costs a few struct packs per step.
+
+Run "python LeapOfFaith.py --trace session.trace" to record a session, "python statetrace.py session.trace" to
+summarize it, and "python statetrace.py --bench" to measure the cost of recording a step. Reading requires NumPy.
+"""
+
+# Trace File Binary Layout
+TRACE_MAGIC = b'LOFT'
+TRACE_VERSION = 1
+HEADER = struct.Struct('<4sBHIQ')  # Magic, Version, Record Size, Capacity, Records Written
+# Seed, Tick, Hero, Action, Events, Hero Rect, Hero Flags, State, Frame, Health, Cause, Level, Fall Distance, Tiles
+RECORD = struct.Struct('<QIBBBhhhhBBBbBhIB')
+TILE = struct.Struct('<bBhh')  # Type, Flags, Left, Top
+MAX_TILES = 12  # Tile Slots per Record, at Most Seven Tiles Are on Screen at Once
+RECORD_SIZE = RECORD.size + TILE.size * MAX_TILES
+
+STATES = ('appear', 'idle', 'run', 'fall', 'hit')
+EVENTS = ('spawn', 'damage', 'heal', 'break', 'die', 'win')
+# Hero Flags
+FALL, HIT, RUN, CUTSCENE_PLAYED, FACING_RIGHT = 1, 2, 4, 8, 16
+# Tile Flags
+DEALT_DAMAGE, DEALT_HEAL, TRIGGERED = 1, 2, 4
+
+EVENT_BITS = {name: 1 << i for i, name in enumerate(EVENTS)}
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+TYPE_INDEX = {terrain_type: i for i, terrain_type in enumerate(TERRAIN_TYPES)}
+HERO_INDEX = {hero_type: i for i, hero_type in enumerate(HERO_TYPES)}
+CAUSE_INDEX = {cause: i for i, cause in enumerate(CAUSES)}
+
+
+class TraceRecorder:
+    """A class representing the recorder of a state trace.
+    The file holds a header and capacity records, and record n of the session is written to slot n % capacity,
+    so once the ring is full the oldest steps are overwritten. The header counts the records written so far
+    and is only updated together with the batched flushes, so a reader sees whole batches. Tiles beyond
+    MAX_TILES are left out of a record and counted as dropped."""
+
+    def __init__(self, path, capacity=TRACE_FRAMES, flushEvery=TRACE_FLUSH):
+        self.path = path
+        self.capacity = capacity
+        self.flush_every = flushEvery
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.file = open(path, 'w+b')
+        self.file.truncate(HEADER.size + capacity * RECORD_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        HEADER.pack_into(self.map, 0, TRACE_MAGIC, TRACE_VERSION, RECORD_SIZE, capacity, 0)
+
+    def record(self, simulation, action=ACTION_IDLE, events=()):
+        """Packs the state the simulation reached in its last step, the action and the step's events."""
+        offset = HEADER.size + self.written % self.capacity * RECORD_SIZE
+        hero = simulation.hero
+        rect = hero.rect
+        event_bits = 0
+        for name, _ in events:
+            event_bits |= EVENT_BITS[name]
+        flags = FALL * hero.fall | HIT * hero.hit | RUN * hero.run | \
+            CUTSCENE_PLAYED * hero.cutscene_played | FACING_RIGHT * (hero.direction == 'right')
+        terrains = simulation.terrains
+        if len(terrains) > MAX_TILES:
+            self.dropped += len(terrains) - MAX_TILES
+            terrains = terrains[:MAX_TILES]
+
+        RECORD.pack_into(self.map, offset, simulation.seed, simulation.tick, HERO_INDEX[simulation.hero_type],
+                         action, event_bits, rect.x, rect.y, rect.w, rect.h, flags, STATE_INDEX[hero.state],
+                         hero.frame, hero.health, CAUSE_INDEX[simulation.cause], simulation.level,
+                         simulation.fall_dist, len(terrains))
+        offset += RECORD.size
+        for terrain in terrains:
+            TILE.pack_into(self.map, offset, TYPE_INDEX[terrain.type],
+                           DEALT_DAMAGE * terrain.has_dealt_damage | DEALT_HEAL * terrain.has_dealt_heal |
+                           TRIGGERED * terrain.has_trigger, terrain.rect.x, terrain.rect.y)
+            offset += TILE.size
+
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        """Publishes the records written so far in the header and flushes the mapped file to disk."""
+        struct.pack_into('<Q', self.map, HEADER.size - 8, self.written)
+        self.map.flush()
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+    def stats(self):
+        """Returns the records written and kept, the tiles dropped and the flushes."""
+        return {
+            'written': self.written,
+            'kept': min(self.written, self.capacity),
+            'dropped_tiles': self.dropped,
+            'flushes': self.flushes,
+            'bytes': HEADER.size + self.capacity * RECORD_SIZE,
+        }
+
+
+def record_dtype():
+    """Returns the NumPy structured type of one record, laid out exactly like RECORD and TILE."""
+    import numpy as np
+    tile = np.dtype([('type', 'i1'), ('flags', 'u1'), ('x', '<i2'), ('y', '<i2')])
+    return np.dtype([
+        ('seed', '<u8'), ('tick', '<u4'), ('hero', 'u1'), ('action', 'u1'), ('events', 'u1'),
+        ('x', '<i2'), ('y', '<i2'), ('w', '<i2'), ('h', '<i2'), ('flags', 'u1'), ('state', 'u1'),
+        ('frame', 'u1'), ('health', 'i1'), ('cause', 'u1'), ('level', '<i2'), ('fall_dist', '<u4'),
+        ('tiles', 'u1'), ('tile', tile, (MAX_TILES,)),
+    ])
+
+
+def read_trace(path):
+    """Reads a trace into a dict of NumPy arrays, one entry per record field, ordered from the oldest
+    kept step to the newest. Tile fields are (steps, MAX_TILES) arrays whose unused slots have type -1."""
+    # NumPy is only needed to read traces, so the game can record them without it
+    import numpy as np
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, record_size, capacity, written = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f'{path} is not a version {TRACE_VERSION} state trace')
+    records = np.frombuffer(data, record_dtype(), capacity, HEADER.size)
+    if written > capacity:
+        start = written % capacity
+        records = np.concatenate((records[start:], records[:start]))
+    else:
+        records = records[:written]
+
+    trace = {name: records[name].copy() for name in records.dtype.names if name != 'tile'}
+    unused = np.arange(MAX_TILES) >= records['tiles'][:, None]
+    for name in ('type', 'flags', 'x', 'y'):
+        trace[f'tile_{name}'] = records['tile'][name].copy()
+    trace['tile_type'][unused] = -1
+    return trace
+
+
+def summarize(trace):
+    """Returns the steps, runs, event counts and hero state counts of a trace."""
+    import numpy as np
+    runs = int(np.count_nonzero(np.diff(trace['tick'].astype(np.int64)) <= 0)) + 1 if len(trace['tick']) else 0
+    return {
+        'steps': len(trace['tick']),
+        'runs': runs,
+        'events': {name: int(np.count_nonzero(trace['events'] & EVENT_BITS[name])) for name in EVENTS},
+        'states': {state: int(np.count_nonzero(trace['state'] == i)) for i, state in enumerate(STATES)},
+        'max_tiles': int(trace['tiles'].max()) if len(trace['tiles']) else 0,
+    }
+
+
+def benchmark(steps=20000, path='benchmark.trace'):
+    """Records a headless run with the heuristic player and prints the cost of recording one step."""
+    from simulation import Simulation, heuristic_action
+    simulation = Simulation(HERO_TYPES[0], 1)
+    recorder = TraceRecorder(path)
+    elapsed = 0
+    for _ in range(steps):
+        if simulation.done:
+            simulation.reset(HERO_TYPES[0])
+        action = heuristic_action(simulation)
+        events = simulation.step(action)
+        start = time.perf_counter()
+        recorder.record(simulation, action, events)
+        elapsed += time.perf_counter() - start
+    recorder.close()
+    print(f'{elapsed / steps * 1e6:.2f} us per step recorded, {elapsed / steps * FPS * 100:.3f}% of a second '
+          f'at {FPS} steps per second, {recorder.stats()}')
+    start = time.perf_counter()
+    trace = read_trace(path)
+    print(f'read {len(trace["tick"])} steps in {(time.perf_counter() - start) * 1000:.1f} ms')
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Summarizes a state trace recorded with LeapOfFaith.py --trace, or measures recording.')
+    parser.add_argument('path', nargs='?', help='trace file to summarize')
+    parser.add_argument('--npz', metavar='PATH', help='also save the trace arrays to a NumPy .npz file')
+    parser.add_argument('--bench', action='store_true', help='measure the cost of recording a step')
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+    elif args.path:
+        trace = read_trace(args.path)
+        for name, value in summarize(trace).items():
+            print(f'{name}: {value}')
+        if args.npz:
+            import numpy as np
+            np.savez_compressed(args.npz, **trace)
+            print(f'Arrays written to {args.npz}')
+    else:
+        parser.error('give a trace file or --bench')
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+from random import Random
+from statistics import mean, median
+from settings import *
+from replay import CAUSES, HERO_TYPES
+from levels import level_spawns
+from simulation import Simulation, heuristic_action
+
+"""
+The sweep module for the "Leap of Faith: The 100-Floor Trials" game. This module plays many complete runs headlessly
+to tune the difficulty settings, TERRAIN_SPAWN_WEIGHTS, TERRAIN_SPAWN_FREQ and MAX_HEALTH, and to soak test the rules.
+Every combination of the given settings is played over a range of seeds by a scripted player. The runs are spread
+in batches of seeds over a pool of worker processes, each with its own simulation, so the throughput grows with the
+number of cores. Results stream back as batches finish and are aggregated into a report per setting.
+
+The final levels and deaths measure the scripted player as much as the settings. The heuristic player dies around
+level 97 on average, mostly by falling, although the level generator only accepts survivable layouts, so small
+differences between settings can drown in its mistakes. The report therefore also gives the level generator's counts
+for the layouts that were played, generated on to all 100 floors after a run ends: the share of drawn chunks its
+reachability pass rejected and redrew, and the layouts holding a chunk it gave up on and kept unchecked. These don't
+depend on the player.
+
+Run "python sweep.py --seeds 1000 --max-health 3 5" to compare two health settings over 1000 seeds each.
+"""
+
+PLAYERS = ('heuristic', 'random')
+BATCH_SEEDS = 25  # Seeds Played per Worker Task
+MIN_SPAWN_FREQ = -(-1000 // FPS)  # Milliseconds of One Tick, the Shortest Spawn Interval
+
+
+def random_player(seed):
+    """Returns a player that holds a random action for a random number of steps, seeded by the run's seed."""
+    rng = Random(seed)
+    state = {'action': ACTION_IDLE, 'steps': 0}
+
+    def act(simulation):
+        if state['steps'] == 0:
+            state['action'] = rng.choice((ACTION_IDLE, ACTION_LEFT, ACTION_RIGHT))
+            state['steps'] = rng.randint(5, 30)
+        state['steps'] -= 1
+        return state['action']
+    return act
+
+
+def play_batch(task):
+    """Plays the runs of one batch of seeds with one setting and returns a result row per run."""
+    setting, seeds, player, max_steps, step_ticks = task
+    weights, spawn_freq, max_health = setting
+    spawn_ticks = spawn_freq * FPS // 1000
+    simulation = None
+    rows = []
+    for seed in seeds:
+        hero_type = HERO_TYPES[seed % len(HERO_TYPES)]
+        if simulation is None:
+            simulation = Simulation(hero_type, seed, spawn_ticks, weights, max_health, step_ticks)
+        else:
+            simulation.reset(hero_type, seed)
+        act = heuristic_action if player == 'heuristic' else random_player(seed)
+        while not simulation.done and simulation.tick < max_steps:
+            simulation.step(act(simulation))
+        # Count the redraws of the whole layout of the seed, not just the floors the player reached
+        levels = simulation.levels
+        levels.generate_until(level_spawns(spawn_ticks))
+        rows.append({
+            'setting': setting_name(setting),
+            'seed': seed,
+            'hero': hero_type,
+            'level': simulation.level,
+            'cause': simulation.cause or 'timeout',
+            'steps': simulation.tick,
+            'health': simulation.hero.health,
+            'chunks': levels.chunks,
+            'redrawn': levels.redrawn,
+            'unchecked': levels.unchecked,
+        })
+    return rows
+
+
+def setting_name(setting):
+    weights, spawn_freq, max_health = setting
+    return f'weights={"/".join(map(str, weights))} freq={spawn_freq} health={max_health}'
+
+
+def summarize(rows):
+    """Returns the aggregated report of the runs of one setting."""
+    levels = [row['level'] for row in rows]
+    causes = {cause or 'timeout': 0 for cause in CAUSES}
+    for row in rows:
+        causes[row['cause']] += 1
+    return {
+        'runs': len(rows),
+        'mean_level': mean(levels),
+        'median_level': median(levels),
+        'floors_cleared': TOP_LEVEL - mean(levels),
+        'wins': causes.pop('win'),
+        'deaths': causes,
+        'rejected_chunks': sum(row['redrawn'] for row in rows) /
+        sum(row['chunks'] + row['redrawn'] for row in rows),
+        'unchecked_layouts': sum(row['unchecked'] > 0 for row in rows),
+        'steps': sum(row['steps'] for row in rows),
+    }
+
+
+def sweep(settings, seeds, player='heuristic', maxSteps=60000, workers=None, runsPath=None, stepTicks=1):
+    """Plays every setting over every seed on a pool of worker processes,
+    streaming the runs to an optional CSV file, and returns the report per setting.
+    With stepTicks above 1 the player only acts every that many ticks."""
+    tasks = [(setting, seeds[i:i + BATCH_SEEDS], player, maxSteps, stepTicks)
+             for setting in settings for i in range(0, len(seeds), BATCH_SEEDS)]
+    runs = {setting_name(setting): [] for setting in settings}
+    total = len(settings) * len(seeds)
+    done = steps = 0
+    start = time.perf_counter()
+    runs_file = open(runsPath, 'w', newline='') if runsPath else None
+    writer = None
+    try:
+        with Pool(workers) as pool:
+            # Batches are collected in whatever order they finish, so a slow batch never holds up the others
+            for rows in pool.imap_unordered(play_batch, tasks):
+                for row in rows:
+                    runs[row['setting']].append(row)
+                if runs_file is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(runs_file, rows[0].keys())
+                        writer.writeheader()
+                    writer.writerows(rows)
+                done += len(rows)
+                steps += sum(row['steps'] for row in rows)
+                elapsed = time.perf_counter() - start
+                print(f'\r{done}/{total} runs, {steps / elapsed:.0f} steps per second', end='', flush=True)
+    finally:
+        if runs_file is not None:
+            runs_file.close()
+    print()
+    return {name: summarize(rows) for name, rows in runs.items()}
+
+
+def parse_spawn_freq(text):
+    spawn_freq = int(text)
+    if spawn_freq < MIN_SPAWN_FREQ:
+        raise argparse.ArgumentTypeError(f'spawn frequency must be at least {MIN_SPAWN_FREQ} ms, one tick')
+    return spawn_freq
+
+
+def parse_max_health(text):
+    max_health = int(text)
+    if max_health <= 0:
+        raise argparse.ArgumentTypeError('hero health must be at least 1')
+    return max_health
+
+
+def parse_weights(text):
+    weights = [int(weight) for weight in text.split(',')]
+    if len(weights) != len(TERRAIN):
+        raise argparse.ArgumentTypeError(f'expected {len(TERRAIN)} comma separated weights')
+    return tuple(weights)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Play many seeded runs headlessly on all cores and aggregate the results per setting.')
+    parser.add_argument('--seeds', type=int, default=200,
+                        help='number of seeds per setting, from --first-seed upwards, 200 by default')
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--weights', type=parse_weights, nargs='+', default=[tuple(TERRAIN_SPAWN_WEIGHTS)],
+                        help=f'terrain spawn weights in the order {", ".join(TERRAIN)}, e.g. 40,20,10,10,10,10')
+    parser.add_argument('--spawn-freq', type=parse_spawn_freq, nargs='+', default=[TERRAIN_SPAWN_FREQ],
+                        help=f'milliseconds between terrain spawns, at least {MIN_SPAWN_FREQ}, '
+                             f'{TERRAIN_SPAWN_FREQ} by default')
+    parser.add_argument('--max-health', type=parse_max_health, nargs='+', default=[MAX_HEALTH],
+                        help=f'hero health, at least 1, {MAX_HEALTH} by default')
+    parser.add_argument('--player', choices=PLAYERS, default='heuristic',
+                        help='scripted player, the heuristic player by default')
+    parser.add_argument('--max-steps', type=int, default=60000,
+                        help='ticks after which a run is stopped and counted as a timeout')
+    parser.add_argument('--step-ticks', type=int, default=1,
+                        help='ticks of the 60 FPS game covered by each simulation step, 1 by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='worker processes, one per core by default')
+    parser.add_argument('--runs', metavar='PATH', help='stream every run to a CSV file')
+    parser.add_argument('--output', metavar='PATH', help='write the report to a JSON file')
+    args = parser.parse_args()
+
+    settings = list(itertools.product(args.weights, args.spawn_freq, args.max_health))
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+    start = time.perf_counter()
+    report = sweep(settings, seeds, args.player, args.max_steps, args.workers, args.runs, args.step_ticks)
+    elapsed = time.perf_counter() - start
+
+    for name, summary in report.items():
+        deaths = ', '.join(f'{cause} {count}' for cause, count in summary['deaths'].items())
+        print(f'{name}: mean level {summary["mean_level"]:.1f}, median {summary["median_level"]:.0f}, '
+              f'{summary["wins"]} wins of {summary["runs"]}, deaths: {deaths}; '
+              f'generator: {summary["rejected_chunks"]:.1%} of drawn chunks redrawn, '
+              f'{summary["unchecked_layouts"]} layouts with unchecked chunks')
+    print(f'Levels and deaths are those of the {args.player} player, which also dies on survivable layouts; '
+          f'the generator counts cover whole 100-floor layouts and don\'t depend on the player')
+    steps = sum(summary['steps'] for summary in report.values())
+    print(f'{len(settings) * len(seeds)} runs and {steps} steps in {elapsed:.1f} s on {args.workers} workers, '
+          f'{steps / elapsed:.0f} steps per second')
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)